@@ -0,0 +1,23 @@
+"""add feature row version for optimistic concurrency
+
+Revision ID: 3d9b7f2e6a51
+Revises: e7a2d4c83f19
+Create Date: 2026-10-17 16:08:42.517390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+revision = '3d9b7f2e6a51'
+down_revision = 'e7a2d4c83f19'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Incremented on every write; writers may send the version they read
+    op.add_column('features', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade() -> None:
+    op.drop_column('features', 'version')
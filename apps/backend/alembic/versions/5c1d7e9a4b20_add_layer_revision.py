@@ -0,0 +1,23 @@
+"""add layer revision counter
+
+Revision ID: 5c1d7e9a4b20
+Revises: b2f940b01730
+Create Date: 2026-10-17 09:12:40.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+revision = '5c1d7e9a4b20'
+down_revision = 'b2f940b01730'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Bumped by every feature write on the layer; used for ETags
+    op.add_column('layers', sa.Column('revision', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade() -> None:
+    op.drop_column('layers', 'revision')
@@ -0,0 +1,24 @@
+"""add gist index on features.geom
+
+Revision ID: 8e3a61f2c7d4
+Revises: 5c1d7e9a4b20
+Create Date: 2026-10-17 10:03:11.574120
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+revision = '8e3a61f2c7d4'
+down_revision = '5c1d7e9a4b20'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Same name GeoAlchemy2 uses for spatial_index=True, so databases that
+    # already have it (created by hand or by create_all) are left untouched
+    op.execute('CREATE INDEX IF NOT EXISTS idx_features_geom ON features USING gist (geom)')
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX IF EXISTS idx_features_geom')
@@ -0,0 +1,52 @@
+"""add local mirror of active containers with trigram indexes
+
+Revision ID: a61c5e8d2b47
+Revises: 3d9b7f2e6a51
+Create Date: 2026-10-17 17:22:30.904126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+revision = 'a61c5e8d2b47'
+down_revision = '3d9b7f2e6a51'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    # Columns advanced search reads from zabojniki_proizvodnje_tisna5237_aktivni,
+    # refreshed by app/mirror.py
+    op.create_table(
+        'zabojniki_aktivni_mirror',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('Odlagalna cona', sa.String(), nullable=True),
+        sa.Column('Operacija', sa.Integer(), nullable=True),
+        sa.Column('Status', sa.String(), nullable=True),
+        sa.Column('Artikel', sa.String(), nullable=True),
+        sa.Column('Dodatna oznaka zabojnika', sa.String(), nullable=True),
+        sa.Column('Nalog', sa.String(), nullable=True),
+        sa.Column('ONK', sa.String(), nullable=True),
+    )
+    # text_pattern_ops so LIKE 'prefix%' on the cona can use the btree
+    op.create_index(
+        'idx_zabojniki_mirror_cona_operacija', 'zabojniki_aktivni_mirror', ['Odlagalna cona', 'Operacija'],
+        postgresql_ops={'Odlagalna cona': 'text_pattern_ops'},
+    )
+    # LIKE '%...%' filters
+    for name, column in (
+        ('idx_zabojniki_mirror_artikel_trgm', 'Artikel'),
+        ('idx_zabojniki_mirror_nalog_trgm', 'Nalog'),
+        ('idx_zabojniki_mirror_onk_trgm', 'ONK'),
+        ('idx_zabojniki_mirror_dodatna_trgm', 'Dodatna oznaka zabojnika'),
+    ):
+        op.create_index(
+            name, 'zabojniki_aktivni_mirror', [column],
+            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'},
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('zabojniki_aktivni_mirror')
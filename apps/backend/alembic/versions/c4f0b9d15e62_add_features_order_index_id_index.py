@@ -0,0 +1,23 @@
+"""add (order_index, id) index for keyset pagination
+
+Revision ID: c4f0b9d15e62
+Revises: 8e3a61f2c7d4
+Create Date: 2026-10-17 11:20:52.091337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+revision = 'c4f0b9d15e62'
+down_revision = '8e3a61f2c7d4'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Matches ORDER BY order_index, id of GET /features/ pages
+    op.create_index('idx_features_order_index_id', 'features', ['order_index', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_features_order_index_id', table_name='features')
@@ -0,0 +1,40 @@
+"""add feature revision, updated_at and tombstones for delta sync
+
+Revision ID: e7a2d4c83f19
+Revises: c4f0b9d15e62
+Create Date: 2026-10-17 13:41:07.862915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+revision = 'e7a2d4c83f19'
+down_revision = 'c4f0b9d15e62'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Layer revision of each row's last write
+    op.add_column('features', sa.Column('revision', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('features', sa.Column('updated_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()))
+    op.create_index('idx_features_layer_id_revision', 'features', ['layer_id', 'revision'])
+
+    # Features that left a layer (deleted or moved away)
+    op.create_table(
+        'feature_tombstones',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('feature_id', sa.Integer(), nullable=False),
+        sa.Column('layer_id', sa.Integer(), sa.ForeignKey('layers.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('revision', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+    )
+    op.create_index('idx_feature_tombstones_layer_id_revision', 'feature_tombstones', ['layer_id', 'revision'])
+
+
+def downgrade() -> None:
+    op.drop_index('idx_feature_tombstones_layer_id_revision', table_name='feature_tombstones')
+    op.drop_table('feature_tombstones')
+    op.drop_index('idx_features_layer_id_revision', table_name='features')
+    op.drop_column('features', 'updated_at')
+    op.drop_column('features', 'revision')
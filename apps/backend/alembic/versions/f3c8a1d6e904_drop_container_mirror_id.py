@@ -0,0 +1,24 @@
+"""drop the surrogate id of the container mirror
+
+Revision ID: f3c8a1d6e904
+Revises: a61c5e8d2b47
+Create Date: 2026-10-17 19:41:06.318254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+revision = 'f3c8a1d6e904'
+down_revision = 'a61c5e8d2b47'
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    # Nothing reads it, and the serial burned a full table's worth of ids per
+    # refresh; the mirror is now rebuilt and swapped in whole (app/mirror.py)
+    op.drop_column('zabojniki_aktivni_mirror', 'id')
+
+
+def downgrade() -> None:
+    op.execute('ALTER TABLE zabojniki_aktivni_mirror ADD COLUMN id bigint GENERATED ALWAYS AS IDENTITY PRIMARY KEY')
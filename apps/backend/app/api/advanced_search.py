@@ -1,17 +1,39 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import List, Optional
-from sqlalchemy import text, create_engine
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.db import engine
+from app.cache import annotations_cache
 from app.config import settings
+from app.mirror import CONTAINER_TABLE, ContainerSessionLocal
+from app.crud import LEVEL_PREFIX_LEN
+from app.occupancy import cona_counts_sql
 import pandas as pd
 
-zabojniki_engine = create_engine(
-    settings.source_database_url,
-    echo=False
-)
-
 router = APIRouter()
 
+
+async def get_container_db():
+    """Session on the database CONTAINER_TABLE lives in."""
+    async with ContainerSessionLocal() as session:
+        yield session
+
+
+def _no_matches() -> dict:
+    return {
+        "annotations": [],
+        "total_count": 0,
+        "message": "No matching odlagalne cone found"
+    }
+
+
+def _with_filters(result: dict, filters_applied: dict) -> dict:
+    """Cached results are shared between requests; the echoed filters are per request."""
+    if "message" in result:
+        return result
+    return {**result, "filters_applied": filters_applied}
+
+
 @router.get("/advanced-search/annotations")
 async def get_filtered_annotations(
     odlagalne_zone: Optional[str] = Query(None, description="Odlagalna zona filter"),
@@ -23,11 +45,14 @@ async def get_filtered_annotations(
     mode: Optional[str] = Query("agg_Artikel_Cona", description="Aggregation mode"),
     indicator_mode: Optional[str] = Query("Artikel", description="Indicator mode"),
     nalog: Optional[str] = Query(None, description="Nalog filter (contains)"),
-    onk: Optional[str] = Query(None, description="ONK filter (contains)")
+    onk: Optional[str] = Query(None, description="ONK filter (contains)"),
+    refresh: bool = Query(False, description="Bypass the result cache and store a fresh result"),
+    container_db: AsyncSession = Depends(get_container_db)
 ):
     """
     Get filtered annotations based on zabojniki_proizvodnje_tisna5237_aktivni data
-    and join with features table to get only relevant odlagalne cone
+    and join with features table to get only relevant odlagalne cone.
+    Results are cached for SEARCH_CACHE_TTL_SECONDS per normalized filter set.
     """
     try:
         # print(f"=== ADVANCED SEARCH BACKEND DEBUG ===")
@@ -51,6 +76,30 @@ async def get_filtered_annotations(
         # print(f"  status_list: {status_list}")
         # print(f"  dodatne_oznake_list: {dodatne_oznake_list}")
         
+        filters_applied = {
+            "odlagalne_zone": odlagalne_zone,
+            "od_operacije": od_operacije,
+            "do_operacije": do_operacije,
+            "status": status_list,
+            "artikel": artikel,
+            "dodatne_oznake": dodatne_oznake_list,
+            "mode": mode,
+            "indicator_mode": indicator_mode,
+            "nalog": nalog,
+            "onk": onk
+        }
+        
+        # Status (IN) and dodatne oznake (OR) lists match the same rows in any
+        # order, so they are sorted for the key; mode and indicator_mode only
+        # affect the echoed filters_applied
+        cache_key = (
+            odlagalne_zone, od_operacije, do_operacije, tuple(sorted(set(status_list))),
+            artikel, tuple(sorted(set(dodatne_oznake_list))), nalog, onk
+        )
+        cached = None if refresh else annotations_cache.get(cache_key)
+        if cached is not None:
+            return _with_filters(cached, filters_applied)
+        
         # Build the query to get zabojniki data with odlagalne cone
         where_clauses = []
         params = {}
@@ -105,128 +154,100 @@ async def get_filtered_annotations(
         if where_clauses:
             where_clause = "WHERE " + " AND ".join(where_clauses)
         
-        # Query to get aggregated zabojniki data with counts per odlagalna cona
-        # We need 3 levels of aggregation: 4, 5, and 6 characters
-        zabojniki_query = f"""
-        WITH aggregated_data AS (
-            SELECT 
-                "Odlagalna cona",
-                LEFT("Odlagalna cona", 4) as cona_4,
-                LEFT("Odlagalna cona", 5) as cona_5,
-                LEFT("Odlagalna cona", 6) as cona_6,
-                COUNT(*) as zabojniki_count
-            FROM zabojniki_proizvodnje_tisna5237_aktivni
-            {where_clause}
-            GROUP BY "Odlagalna cona"
-        )
-        SELECT 
-            "Odlagalna cona",
-            cona_4,
-            cona_5,
-            cona_6,
-            zabojniki_count
-        FROM aggregated_data
-        """
+        # Exact, 4-, 5- and 6-character totals in one pass (see cona_counts_sql)
+        zabojniki_query = cona_counts_sql(CONTAINER_TABLE, where_clause)
         
-        # Execute query to get odlagalne cone with counts from zabojniki database
-        print(f"Executing zabojniki query with params: {params}")
-        with zabojniki_engine.connect() as connection:
-            result = connection.execute(text(zabojniki_query), params)
-            zabojniki_data = result.fetchall()
-        
-        print(f"Zabojniki query returned {len(zabojniki_data)} rows")
-        if zabojniki_data:
-            print(f"First few rows: {zabojniki_data[:3]}")
-        
-        if not zabojniki_data:
-            print("No zabojniki data found, returning empty result")
-            return {
-                "annotations": [],
-                "total_count": 0,
-                "message": "No matching odlagalne cone found"
-            }
-        
-        # Create mappings for different aggregation levels
-        cona_counts = {}
-        cona_4_counts = {}
-        cona_5_counts = {}
-        cona_6_counts = {}
-        
-        for row in zabojniki_data:
-            odlagalna_cona = row[0]
-            cona_4 = row[1]
-            cona_5 = row[2]
-            cona_6 = row[3]
-            count = row[4]
-            
-            # Store exact match
-            cona_counts[odlagalna_cona] = count
+        if settings.search_use_mirror:
+            # The mirror lives next to features: count and match in one statement
+            print(f"Executing zabojniki + features query with params: {params}")
+            counts_cte = f"""
+            counts AS (
+                SELECT * FROM ({zabojniki_query}) z WHERE cona_key IS NOT NULL
+            )"""
+            features_params = params
+        else:
+            # Execute query to get odlagalne cone with counts from zabojniki database
+            print(f"Executing zabojniki query with params: {params}")
+            # Async and pooled, so a slow container query does not block other requests
+            result = await container_db.execute(text(zabojniki_query), params)
+            zabojniki_data = [row for row in result.fetchall() if row.cona_key is not None]
             
-            # Aggregate by 4 characters (Polje level)
-            cona_4_counts[cona_4] = cona_4_counts.get(cona_4, 0) + count
+            print(f"Zabojniki query returned {len(zabojniki_data)} rows")
+            if zabojniki_data:
+                print(f"First few rows: {zabojniki_data[:3]}")
             
-            # Aggregate by 5 characters (Subzone level)
-            cona_5_counts[cona_5] = cona_5_counts.get(cona_5, 0) + count
+            if not zabojniki_data:
+                print("No zabojniki data found, returning empty result")
+                result = _no_matches()
+                annotations_cache.put(cache_key, result)
+                return result
             
-            # Aggregate by 6 characters (Vrsta level)
-            cona_6_counts[cona_6] = cona_6_counts.get(cona_6, 0) + count
+            # A string is often a key at several prefix lengths (a short exact
+            # cona is also a 4-character prefix), so each distinct key is sent
+            # once with one count column per prefix length
+            by_key = {}
+            for row in zabojniki_data:
+                by_key.setdefault(row.cona_key, {})[row.prefix_len] = row.zabojniki_count
+            counts_cte = """
+            counts AS (
+                SELECT l.prefix_len, k.cona_key, l.zabojniki_count
+                FROM unnest(
+                    CAST(:cona_keys AS text[]),
+                    CAST(:counts_0 AS bigint[]),
+                    CAST(:counts_4 AS bigint[]),
+                    CAST(:counts_5 AS bigint[]),
+                    CAST(:counts_6 AS bigint[])
+                ) AS k(cona_key, c0, c4, c5, c6)
+                CROSS JOIN LATERAL (VALUES (0, k.c0), (4, k.c4), (5, k.c5), (6, k.c6)) AS l(prefix_len, zabojniki_count)
+                WHERE l.zabojniki_count IS NOT NULL
+            )"""
+            features_params = {"cona_keys": list(by_key)}
+            for prefix_len in (0, 4, 5, 6):
+                features_params[f"counts_{prefix_len}"] = [counts.get(prefix_len) for counts in by_key.values()]
         
-        # Get all possible odlagalne cone for features query
-        all_odlagalne_cone = set()
-        all_odlagalne_cone.update(cona_counts.keys())
-        all_odlagalne_cone.update(cona_4_counts.keys())
-        all_odlagalne_cone.update(cona_5_counts.keys())
-        all_odlagalne_cone.update(cona_6_counts.keys())
-        
-        # Now get features that match these odlagalne cone
-        features_query = """
+        # Features whose cona is any of the keys, counted at their level:
+        # polje by 4, subzone by 5, vrsta by 6 characters, others exactly
+        features_query = f"""
+        WITH {counts_cte}
         SELECT 
-            id,
-            name,
-            color,
-            properties,
-            ST_AsGeoJSON(geom)::json as geom,
-            x_coord,
-            y_coord,
-            cona,
-            max_capacity,
-            taken_capacity,
-            level
-        FROM features
-        WHERE cona = ANY(:odlagalne_cone)
-        ORDER BY name
+            f.id,
+            f.name,
+            f.color,
+            f.properties,
+            ST_AsGeoJSON(f.geom)::json as geom,
+            f.x_coord,
+            f.y_coord,
+            f.cona,
+            f.max_capacity,
+            COALESCE(c.zabojniki_count, 0) as zabojniki_count,
+            f.level
+        FROM features f
+        LEFT JOIN counts c
+            ON c.prefix_len = {LEVEL_PREFIX_LEN}
+            AND c.cona_key = CASE c.prefix_len WHEN 0 THEN f.cona ELSE LEFT(f.cona, c.prefix_len) END
+        WHERE EXISTS (SELECT 1 FROM counts k WHERE k.cona_key = f.cona)
+        ORDER BY f.name
         """
         
         # Execute features query from features database
         async with engine.begin() as connection:
-            features_result = await connection.execute(text(features_query), {"odlagalne_cone": list(all_odlagalne_cone)})
+            features_result = await connection.execute(text(features_query), features_params)
             features = features_result.fetchall()
+            
+            if settings.search_use_mirror and not features:
+                # Same answer as the source path: the message only when no container matched
+                counts_result = await connection.execute(text(f"""
+                SELECT EXISTS (SELECT 1 FROM ({zabojniki_query}) z WHERE cona_key IS NOT NULL)
+                """), params)
+                if not counts_result.scalar_one():
+                    print("No zabojniki data found, returning empty result")
+                    result = _no_matches()
+                    annotations_cache.put(cache_key, result)
+                    return result
         
         # Convert to list of dictionaries
         annotations = []
         for feature in features:
-            cona = feature[7]  # feature[7] is cona
-            level = feature[10]  # feature[10] is level
-            
-            # Determine the appropriate count based on level and cona length
-            zabojniki_count = 0
-            
-            if level == 'polje':
-                # For polje level, use 4-character aggregation
-                cona_4 = cona[:4] if len(cona) >= 4 else cona
-                zabojniki_count = cona_4_counts.get(cona_4, 0)
-            elif level == 'subzone':
-                # For subzone level, use 5-character aggregation
-                cona_5 = cona[:5] if len(cona) >= 5 else cona
-                zabojniki_count = cona_5_counts.get(cona_5, 0)
-            elif level == 'vrsta':
-                # For vrsta level, use 6-character aggregation
-                cona_6 = cona[:6] if len(cona) >= 6 else cona
-                zabojniki_count = cona_6_counts.get(cona_6, 0)
-            else:
-                # Fallback to exact match
-                zabojniki_count = cona_counts.get(cona, 0)
-            
             annotation = {
                 "id": feature[0],
                 "name": feature[1],
@@ -235,32 +256,22 @@ async def get_filtered_annotations(
                 "geom": feature[4],
                 "x_coord": float(feature[5]) if feature[5] else None,
                 "y_coord": float(feature[6]) if feature[6] else None,
-                "cona": cona,
+                "cona": feature[7],
                 "max_capacity": feature[8],
-                "taken_capacity": zabojniki_count,  # Use aggregated count from zabojniki
-                "level": level,
+                "taken_capacity": feature[9],  # Use aggregated count from zabojniki
+                "level": feature[10],
                 "shape_gl": None,  # Not available in this database
                 "x_coord_gl": None,  # Not available in this database
                 "y_coord_gl": None   # Not available in this database
             }
             annotations.append(annotation)
         
-        return {
+        result = {
             "annotations": annotations,
-            "total_count": len(annotations),
-            "filters_applied": {
-                "odlagalne_zone": odlagalne_zone,
-                "od_operacije": od_operacije,
-                "do_operacije": do_operacije,
-                "status": status_list,
-                "artikel": artikel,
-                "dodatne_oznake": dodatne_oznake_list,
-                "mode": mode,
-                "indicator_mode": indicator_mode,
-                "nalog": nalog,
-                "onk": onk
-            }
+            "total_count": len(annotations)
         }
+        annotations_cache.put(cache_key, result)
+        return _with_filters(result, filters_applied)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching filtered annotations: {str(e)}")
@@ -0,0 +1,149 @@
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Hashable, Iterable, Optional
+from .config import settings
+
+
+@dataclass
+class CacheEntry:
+  body: bytes
+  etag: str
+  media_type: str = 'application/json'
+  # Content-Encoding -> compressed body, filled on first request per encoding
+  encoded: dict[str, bytes] = field(default_factory=dict)
+
+  @property
+  def size(self) -> int:
+    return len(self.body) + sum(len(b) for b in self.encoded.values())
+
+
+class SnapshotCache:
+  """In-process LRU of serialized read payloads, invalidated per layer.
+
+  Entries are tagged with the layer they were built from (None for views that
+  span all layers, which every invalidation drops). Writers invalidate after
+  their commit; readers pass the generation they saw before querying, so a
+  payload read concurrently with a write is never stored.
+  """
+
+  def __init__(self, max_entries: int, max_bytes: int):
+    self.max_entries = max_entries
+    self.max_bytes = max_bytes
+    self._entries: OrderedDict[Hashable, tuple[Optional[int], CacheEntry]] = OrderedDict()
+    self.generation = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.invalidations = 0
+
+  def get(self, key: Hashable) -> Optional[CacheEntry]:
+    item = self._entries.get(key)
+    if item is None:
+      self.misses += 1
+      return None
+    self._entries.move_to_end(key)
+    self.hits += 1
+    return item[1]
+
+  def put(self, key: Hashable, entry: CacheEntry, layer_id: Optional[int], generation: int) -> None:
+    if generation != self.generation or entry.size > self.max_bytes:
+      return
+    self._entries.pop(key, None)
+    self._entries[key] = (layer_id, entry)
+    # Recounted here because compressed variants grow entries after insertion
+    size = self.size
+    while len(self._entries) > self.max_entries or size > self.max_bytes:
+      _, (_, oldest) = self._entries.popitem(last=False)
+      size -= oldest.size
+      self.evictions += 1
+
+  def invalidate_layers(self, layer_ids: Iterable[int]) -> None:
+    """Drop entries of the given layers and every all-layers entry."""
+    layer_ids = set(layer_ids)
+    self.generation += 1
+    self.invalidations += 1
+    stale = [key for key, (layer_id, _) in self._entries.items() if layer_id is None or layer_id in layer_ids]
+    for key in stale:
+      del self._entries[key]
+
+  @property
+  def size(self) -> int:
+    return sum(entry.size for _, entry in self._entries.values())
+
+  def clear(self) -> None:
+    self.generation += 1
+    self._entries.clear()
+
+  def stats(self) -> dict:
+    lookups = self.hits + self.misses
+    return {
+      "entries": len(self._entries),
+      "bytes": self.size,
+      "max_entries": self.max_entries,
+      "max_bytes": self.max_bytes,
+      "hits": self.hits,
+      "misses": self.misses,
+      "hit_rate": self.hits / lookups if lookups else 0.0,
+      "evictions": self.evictions,
+      "invalidations": self.invalidations,
+    }
+
+
+class ResultCache:
+  """In-process LRU of query results that expire after a fixed freshness window.
+
+  For results built from data this app is not told about when it changes
+  (the source database), so age is the only invalidation.
+  """
+
+  def __init__(self, max_entries: int, ttl_seconds: float):
+    self.max_entries = max_entries
+    self.ttl = ttl_seconds
+    self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+    self.expirations = 0
+    self.evictions = 0
+
+  def get(self, key: Hashable) -> Optional[Any]:
+    item = self._entries.get(key)
+    if item is not None and time.monotonic() - item[0] > self.ttl:
+      del self._entries[key]
+      self.expirations += 1
+      item = None
+    if item is None:
+      self.misses += 1
+      return None
+    self._entries.move_to_end(key)
+    self.hits += 1
+    return item[1]
+
+  def put(self, key: Hashable, value: Any) -> None:
+    if self.ttl <= 0:
+      return
+    self._entries.pop(key, None)
+    self._entries[key] = (time.monotonic(), value)
+    while len(self._entries) > self.max_entries:
+      self._entries.popitem(last=False)
+      self.evictions += 1
+
+  def clear(self) -> None:
+    self._entries.clear()
+
+  def stats(self) -> dict:
+    lookups = self.hits + self.misses
+    return {
+      "entries": len(self._entries),
+      "max_entries": self.max_entries,
+      "ttl_seconds": self.ttl,
+      "hits": self.hits,
+      "misses": self.misses,
+      "hit_rate": self.hits / lookups if lookups else 0.0,
+      "expirations": self.expirations,
+      "evictions": self.evictions,
+    }
+
+
+snapshot_cache = SnapshotCache(settings.snapshot_cache_max_entries, settings.snapshot_cache_max_bytes)
+annotations_cache = ResultCache(settings.search_cache_max_entries, settings.search_cache_ttl_seconds)
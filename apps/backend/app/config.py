@@ -27,6 +27,38 @@ class Settings(BaseModel):
   frontend_port_dev: int = int(os.getenv('FRONTEND_PORT_DEV', '8082'))
   frontend_port_prod: int = int(os.getenv('FRONTEND_PORT_PROD', '8082'))
 
+  # Connection pools (app/db.py): the map database and the source database
+  db_pool_size: int = int(os.getenv('DB_POOL_SIZE', '5'))
+  db_max_overflow: int = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+  source_db_pool_size: int = int(os.getenv('SOURCE_DB_POOL_SIZE', '5'))
+  source_db_max_overflow: int = int(os.getenv('SOURCE_DB_MAX_OVERFLOW', '5'))
+  db_pool_timeout: float = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+  db_pool_recycle: int = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+
+  # In-process cache of serialized feature/layer payloads (see app/cache.py)
+  snapshot_cache_max_entries: int = int(os.getenv('SNAPSHOT_CACHE_MAX_ENTRIES', '512'))
+  snapshot_cache_max_bytes: int = int(os.getenv('SNAPSHOT_CACHE_MAX_BYTES', str(128 * 1024 * 1024)))
+  # Unpaginated streamed lists are only cached below this size; bigger ones are just streamed
+  snapshot_cache_stream_max_bytes: int = int(os.getenv('SNAPSHOT_CACHE_STREAM_MAX_BYTES', str(8 * 1024 * 1024)))
+
+  # TTL + LRU cache of /advanced-search/annotations results, keyed by the normalized filters
+  search_cache_ttl_seconds: float = float(os.getenv('SEARCH_CACHE_TTL_SECONDS', '60'))
+  search_cache_max_entries: int = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', '128'))
+
+  # Local mirror of the source container table (app/mirror.py); 0 disables the periodic sync
+  container_mirror_interval_seconds: float = float(os.getenv('CONTAINER_MIRROR_INTERVAL_SECONDS', '300'))
+  # Advanced search reads the mirror instead of the source database
+  search_use_mirror: bool = os.getenv('SEARCH_USE_MIRROR', 'true').lower() in ('1', 'true', 'yes')
+
+  # How often live container counts are written into features.taken_capacity (app/occupancy.py).
+  # Off (0) by default: taken_capacity is then written through the API (create/PATCH/bulk and the
+  # /features/capacity deltas). Opting in (e.g. 60) makes the sync its owner: the delta endpoints
+  # answer 409 and values sent on other writes are overwritten on the next sync
+  occupancy_sync_interval_seconds: float = float(os.getenv('OCCUPANCY_SYNC_INTERVAL_SECONDS', '0'))
+
+  # Deferred geometry PATCHes are coalesced per feature and flushed this often (see app/write_queue.py)
+  write_behind_interval_ms: int = int(os.getenv('WRITE_BEHIND_INTERVAL_MS', '250'))
+
   @property
   def pg_host(self) -> str:
     return self.pg_host_dev if self.dev_mode else self.pg_host_prod
@@ -54,10 +86,19 @@ class Settings(BaseModel):
   def async_database_url(self) -> str:
     return f"postgresql+asyncpg://{self.pg_user}:{self.pg_password}@{self.pg_host}:{self.pg_port}/{self.pg_db}"
   
+  @property
+  def listen_dsn(self) -> str:
+    # Plain asyncpg DSN for the LISTEN connection of app/events.py
+    return f"postgresql://{self.pg_user}:{self.pg_password}@{self.pg_host}:{self.pg_port}/{self.pg_db}"
+  
   @property
   def source_database_url(self) -> str:
     return f"postgresql+psycopg2://{self.pg_user}:{self.pg_password}@{self.pg_host}:{self.pg_port}/{self.source_pg_db}"
 
+  @property
+  def source_async_database_url(self) -> str:
+    return f"postgresql+asyncpg://{self.pg_user}:{self.pg_password}@{self.pg_host}:{self.pg_port}/{self.source_pg_db}"
+
 
 settings = Settings()
 
@@ -1,7 +1,11 @@
-from typing import List
-from sqlalchemy import select
+from typing import Iterable, List
+import json
+import math
+from sqlalchemy import select, text
 from sqlalchemy.ext.asyncio import AsyncSession
 from . import models, schemas
+from .cache import snapshot_cache
+from .events import CHANNEL, change_event
 
 
 async def list_layers(db: AsyncSession) -> List[models.Layer]:
@@ -13,24 +17,173 @@ async def create_layer(db: AsyncSession, data: schemas.LayerCreate) -> models.La
   obj = models.Layer(**data.model_dump())
   db.add(obj)
   await db.commit()
+  snapshot_cache.invalidate_layers([])
   await db.refresh(obj)
   return obj
 
 
+async def get_layer_revision(db: AsyncSession, layer_id: int) -> int:
+  res = await db.execute(select(models.Layer.revision).where(models.Layer.id == layer_id))
+  return res.scalar_one_or_none() or 0
+
+
+async def list_layer_revisions(db: AsyncSession) -> list[tuple[int, int]]:
+  res = await db.execute(select(models.Layer.id, models.Layer.revision).order_by(models.Layer.id))
+  return [(row.id, row.revision) for row in res]
+
+
+async def _finish_layer_write(
+  db: AsyncSession,
+  op: str,
+  revisions: dict[int, int],
+  changed: list[tuple[int, int]] = (),
+  removed: list[tuple[int, int]] = (),
+) -> None:
+  """NOTIFY, commit and invalidate once revisions are bumped and tombstones written.
+
+  Every feature write bumps its layers' revisions (layers locked before
+  features) and writes tombstones in its own statement, then calls this.
+  One NOTIFY per layer goes out with the commit for push subscribers
+  (app/events.py).
+
+  Invalidation has to follow the commit: doing it earlier would let a
+  concurrent read cache the pre-write rows again.
+  """
+  if revisions:
+    # NOTIFY is transactional: listeners only hear about it once committed
+    await db.execute(text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload"), {
+      "channel": CHANNEL,
+      "payloads": [
+        change_event(
+          layer_id, revision, op,
+          changed=[feature_id for feature_id, changed_layer_id in changed if changed_layer_id == layer_id],
+          deleted=[feature_id for feature_id, removed_layer_id in removed if removed_layer_id == layer_id],
+        )
+        for layer_id, revision in revisions.items()
+      ],
+    })
+  await db.commit()
+  snapshot_cache.invalidate_layers(revisions)
+
+
+# For scripts that rewrite features with plain SQL: bump the layers, stamp
+# every row of them with the new revision (and version), and tombstone the
+# ids the script deleted, so ETags, caches and /features/changes see it.
+LAYER_REWRITE_SQL = text("""
+  WITH bumped AS (
+    UPDATE layers SET revision = revision + 1
+    WHERE id = ANY(CAST(:layer_ids AS integer[]))
+    RETURNING id, revision
+  ),
+  stamped AS (
+    UPDATE features f
+    SET revision = b.revision, updated_at = now(), version = f.version + 1
+    FROM bumped b
+    WHERE f.layer_id = b.id
+  ),
+  tombstones AS (
+    INSERT INTO feature_tombstones (feature_id, layer_id, revision)
+    SELECT d.feature_id, d.layer_id, b.revision
+    FROM unnest(CAST(:deleted_ids AS integer[]), CAST(:deleted_layer_ids AS integer[])) AS d(feature_id, layer_id)
+    JOIN bumped b ON b.id = d.layer_id
+  )
+  SELECT id, revision FROM bumped
+""")
+
+
+def record_layer_rewrite(conn, layer_ids: Iterable[int], deleted: Iterable[tuple[int, int]] = ()) -> dict[int, int]:
+  """
+  Revision bookkeeping for a script's direct writes, on its synchronous
+  connection and inside its transaction (call right before committing).
+  `deleted` are (feature_id, layer_id) pairs the script removed. Running
+  servers hear about it through NOTIFY once the script commits.
+  """
+  deleted = list(deleted)
+  result = conn.execute(LAYER_REWRITE_SQL, {
+    "layer_ids": sorted(set(layer_ids)),
+    "deleted_ids": [feature_id for feature_id, _ in deleted],
+    "deleted_layer_ids": [layer_id for _, layer_id in deleted],
+  })
+  revisions = {row.id: row.revision for row in result}
+  for layer_id, revision in revisions.items():
+    # No id lists: subscribers refetch the layer through /features/changes
+    conn.execute(text("SELECT pg_notify(:channel, :payload)"), {
+      "channel": CHANNEL, "payload": change_event(layer_id, revision, 'rewrite', None, None),
+    })
+  return revisions
+
+
+def _polygon_wkt(ring: list) -> str:
+  """WKT of a polygon ring, closing it if needed (first and last point must be the same).
+
+  Raises ValueError/TypeError for anything PostGIS would reject, so callers
+  can report the item instead of failing the whole statement.
+  """
+  points = [(float(x), float(y)) for x, y in ring]
+  if not all(math.isfinite(x) and math.isfinite(y) for x, y in points):
+    raise ValueError("Polygon coordinates must be finite numbers")
+  if points and points[0] != points[-1]:
+    points.append(points[0])  # Close the ring
+  if len(points) < 4:
+    raise ValueError("Polygon must have at least 3 distinct points")
+  return 'POLYGON((' + ','.join(f"{x} {y}" for x, y in points) + '))'
+
+
+def _check_point(x: float, y: float) -> None:
+  """Raise ValueError unless x_coord/y_coord are finite numbers (NaN would be stored as is)."""
+  if not (math.isfinite(x) and math.isfinite(y)):
+    raise ValueError("x_coord and y_coord must be finite numbers")
+
+
+INT32_MIN, INT32_MAX = -2**31, 2**31 - 1
+INTEGER_FIELDS = ('layer_id', 'parent_id', 'order_index', 'depth', 'max_capacity', 'taken_capacity', 'version')
+
+
+def _check_integer_fields(data: schemas.FeatureBase | schemas.FeatureUpdate) -> None:
+  """Raise ValueError if an integer column value would overflow PostgreSQL's integer."""
+  for field in INTEGER_FIELDS:
+    value = getattr(data, field, None)
+    if value is not None and not INT32_MIN <= value <= INT32_MAX:
+      raise ValueError(f"{field}: {value} is out of range for integer")
+
+
 async def list_features(db: AsyncSession) -> List[models.Feature]:
   res = await db.execute(select(models.Feature))
   return list(res.scalars().all())
 
 
-async def create_feature(db: AsyncSession, data: schemas.FeatureCreate) -> models.Feature:
+# What create/update hand back: the stored row with its geometry as GeoJSON
+# and the centroid as x/y, as GET /features/ reads them.
+FEATURE_ROW_COLUMNS = """
+  {p}id, {p}layer_id, {p}parent_id, {p}name, {p}opomba, {p}color, {p}level, {p}order_index, {p}depth,
+  {p}properties, ST_AsGeoJSON({p}geom)::json AS geometry,
+  ST_X(ST_Centroid({p}geom)) AS x_coord, ST_Y(ST_Centroid({p}geom)) AS y_coord,
+  {p}cona, {p}max_capacity, {p}taken_capacity, {p}revision, {p}version
+"""
+
+CREATE_FEATURE_SQL = text(f"""
+  WITH bumped AS (
+    UPDATE layers SET revision = revision + 1 WHERE id = :layer_id RETURNING revision
+  )
+  INSERT INTO features (
+    layer_id, parent_id, name, opomba, color, level, order_index, depth, properties,
+    geom, x_coord, y_coord, cona, max_capacity, taken_capacity, revision, updated_at
+  )
+  VALUES (
+    :layer_id, :parent_id, :name, :opomba, :color, :level, :order_index, :depth, CAST(:properties AS jsonb),
+    ST_GeomFromText(:wkt, 3857), :x_coord, :y_coord, :cona, :max_capacity, :taken_capacity,
+    (SELECT revision FROM bumped), now()
+  )
+  RETURNING {FEATURE_ROW_COLUMNS.format(p='')}
+""")
+
+
+async def create_feature(db: AsyncSession, data: schemas.FeatureCreate):
+  """Insert one feature and return it as stored (see FEATURE_ROW_COLUMNS)."""
   # Geometry is provided as local coordinates; ensure polygon is closed
   ring = data.coordinates
-  # Ensure polygon is closed (first and last point must be the same)
-  if len(ring) < 3:
-    raise ValueError("Polygon must have at least 3 points")
-  if ring[0] != ring[-1]:
-    ring = ring + [ring[0]]  # Close the ring
-  wkt = 'POLYGON((' + ','.join(f"{x} {y}" for x, y in ring) + '))'
+  wkt = _polygon_wkt(ring)
+  _check_integer_fields(data)
   
   # Use default layer_id if not provided
   layer_id = data.layer_id or 1
@@ -39,28 +192,27 @@ async def create_feature(db: AsyncSession, data: schemas.FeatureCreate) -> model
   x_coord = ring[0][0] if ring else None
   y_coord = ring[0][1] if ring else None
   
-  obj = models.Feature(
-    layer_id=layer_id,
-    parent_id=data.parent_id,
-    name=data.name,
-    opomba=data.opomba,
-    color=data.color,
-    level=data.level,
-    order_index=data.order_index,
-    depth=data.depth,
-    properties=data.properties,
-    geom=wkt,  # GeoAlchemy2 will accept WKT for Geometry column
-    x_coord=x_coord,
-    y_coord=y_coord,
-    cona=data.cona,
-    max_capacity=data.max_capacity,
-    taken_capacity=data.taken_capacity,
-  )
-  db.add(obj)
   try:
-    await db.commit()
-    await db.refresh(obj)
-    return obj
+    result = await db.execute(CREATE_FEATURE_SQL, {
+      "layer_id": layer_id,
+      "parent_id": data.parent_id,
+      "name": data.name,
+      "opomba": data.opomba,
+      "color": data.color,
+      "level": data.level,
+      "order_index": data.order_index,
+      "depth": data.depth,
+      "properties": json.dumps(data.properties),
+      "wkt": wkt,
+      "x_coord": x_coord,
+      "y_coord": y_coord,
+      "cona": data.cona,
+      "max_capacity": data.max_capacity,
+      "taken_capacity": data.taken_capacity,
+    })
+    row = result.one()
+    await _finish_layer_write(db, 'create', {row.layer_id: row.revision}, [(row.id, row.layer_id)])
+    return row
   except Exception as e:
     await db.rollback()
     if "unique_name_per_layer" in str(e):
@@ -69,75 +221,575 @@ async def create_feature(db: AsyncSession, data: schemas.FeatureCreate) -> model
 
 
 async def delete_feature(db: AsyncSession, feature_id: int) -> None:
-  obj = await db.get(models.Feature, feature_id)
-  if obj is None:
-    return
-  await db.delete(obj)
-  await db.commit()
+  # Children go with the parent (ON DELETE CASCADE), possibly from other layers
+  await bulk_delete_features(db, [feature_id])
 
 
-async def update_feature(db: AsyncSession, feature_id: int, data: schemas.FeatureUpdate) -> models.Feature | None:
-  obj = await db.get(models.Feature, feature_id)
-  if obj is None:
-    return None
+# Shared by update_feature and bulk_patch_features. {assignments} is built
+# from schema field names only. Both the old layers and the target layer
+# are bumped; features that moved are tombstoned on their old layer. With
+# :expected_version set, a row whose version moved on is left alone.
+FEATURE_PATCH_SQL = """
+  WITH target AS (
+    SELECT id, layer_id AS old_layer_id FROM features WHERE id = ANY(CAST(:ids AS integer[]))
+  ),
+  bumped AS (
+    UPDATE layers SET revision = revision + 1
+    WHERE id IN (SELECT old_layer_id FROM target) OR id = CAST(:layer_id AS integer)
+    RETURNING id, revision
+  ),
+  updated AS (
+    UPDATE features f
+    SET {assignments}, revision = b.revision, updated_at = now(), version = f.version + 1
+    FROM target t, bumped b
+    WHERE f.id = t.id AND b.id = COALESCE(CAST(:layer_id AS integer), t.old_layer_id)
+      AND (CAST(:expected_version AS integer) IS NULL OR f.version = CAST(:expected_version AS integer))
+    RETURNING f.*, t.old_layer_id
+  ),
+  tombstones AS (
+    INSERT INTO feature_tombstones (feature_id, layer_id, revision)
+    SELECT u.id, u.old_layer_id, b.revision
+    FROM updated u JOIN bumped b ON b.id = u.old_layer_id
+    WHERE u.old_layer_id <> u.layer_id
+  )
+  SELECT {columns}, u.old_layer_id, b.revision AS old_revision
+  FROM updated u JOIN bumped b ON b.id = u.old_layer_id
+"""
+
+
+class StaleVersionError(ValueError):
+  """The row's version is not the one the writer expected."""
+
+
+async def update_feature(db: AsyncSession, feature_id: int, data: schemas.FeatureUpdate):
+  """Apply a partial update in one statement and return the row as stored, or None if missing.
+  
+  Raises StaleVersionError if `data.version` is set and no longer current,
+  ValueError for invalid values or a name already taken on the layer.
+  """
+  _check_integer_fields(data)
   payload = data.model_dump(exclude_unset=True)
+  expected_version = payload.pop('version', None)
+  assignments = {}
   if 'coordinates' in payload:
     ring = payload.pop('coordinates')
-    # Ensure polygon is closed (first and last point must be the same)
-    if len(ring) < 3:
-      raise ValueError("Polygon must have at least 3 points")
-    if ring[0] != ring[-1]:
-      ring = ring + [ring[0]]  # Close the ring
-    wkt = 'POLYGON((' + ','.join(f"{x} {y}" for x, y in ring) + '))'
-    obj.geom = wkt
+    assignments['geom'] = ("ST_GeomFromText(:wkt, 3857)", {"wkt": _polygon_wkt(ring)})
     # Update x,y coordinates from the first point of the polygon
-    obj.x_coord = ring[0][0]
-    obj.y_coord = ring[0][1]
+    assignments['x_coord'] = (":x_coord", {"x_coord": ring[0][0]})
+    assignments['y_coord'] = (":y_coord", {"y_coord": ring[0][1]})
   # Use default layer_id if not provided
   if 'layer_id' in payload and payload['layer_id'] is None:
     payload['layer_id'] = 1
   for k, v in payload.items():
-    setattr(obj, k, v)
-  await db.commit()
-  await db.refresh(obj)
-  return obj
+    if k == 'properties':
+      assignments[k] = ("CAST(:properties AS jsonb)", {k: json.dumps(v)})
+    else:
+      assignments[k] = (f":{k}", {k: v})
+  if not assignments:
+    # Nothing to write; still answer with the stored row
+    result = await db.execute(
+      text(f"SELECT {FEATURE_ROW_COLUMNS.format(p='')} FROM features WHERE id = :id"), {"id": feature_id}
+    )
+    return result.one_or_none()
+
+  params = {"ids": [feature_id], "layer_id": payload.get('layer_id'), "expected_version": expected_version}
+  for _, values in assignments.values():
+    params.update(values)
+  try:
+    result = await db.execute(text(FEATURE_PATCH_SQL.format(
+      assignments=', '.join(f"{column} = {value}" for column, (value, _) in assignments.items()),
+      columns=FEATURE_ROW_COLUMNS.format(p='u.'),
+    )), params)
+  except Exception as e:
+    await db.rollback()
+    if "unique_name_per_layer" in str(e):
+      raise ValueError(f"Feature with name '{payload.get('name')}' already exists on the layer")
+    raise e
+  row = result.one_or_none()
+  if row is None:
+    if expected_version is None:
+      return None
+    current = await db.scalar(select(models.Feature.version).where(models.Feature.id == feature_id))
+    if current is None:
+      return None
+    raise StaleVersionError(f"Feature {feature_id} is at version {current}, not {expected_version}")
+  revisions = {row.layer_id: row.revision, row.old_layer_id: row.old_revision}
+  # Moving to another layer removes the feature from the old layer's view
+  removed = [(row.id, row.old_layer_id)] if row.layer_id != row.old_layer_id else []
+  await _finish_layer_write(db, 'update', revisions, [(row.id, row.layer_id)], removed)
+  return row
+
+
+# One statement for the whole batch: bump the revision of every layer that
+# owns a matched feature, then rewrite the matched rows from the arrays.
+# Items carrying a version only match while the row is still at it.
+BULK_UPDATE_SQL = text("""
+  WITH v AS (
+    SELECT *
+    FROM unnest(
+      CAST(:ids AS integer[]), CAST(:wkts AS text[]),
+      CAST(:x_coords AS double precision[]), CAST(:y_coords AS double precision[]),
+      CAST(:versions AS integer[])
+    ) AS v(id, wkt, x_coord, y_coord, version)
+  ),
+  bumped AS (
+    UPDATE layers SET revision = revision + 1
+    WHERE id IN (
+      SELECT f.layer_id FROM features f JOIN v ON v.id = f.id
+      WHERE v.version IS NULL OR f.version = v.version
+    )
+    RETURNING id, revision
+  )
+  UPDATE features AS f
+  SET geom = ST_GeomFromText(v.wkt, 3857),
+      x_coord = v.x_coord,
+      y_coord = v.y_coord,
+      revision = bumped.revision,
+      updated_at = now(),
+      version = f.version + 1
+  FROM v, bumped
+  WHERE f.id = v.id AND f.layer_id = bumped.id
+    -- Compare-and-set on the expected version instead of locking rows up front
+    AND (v.version IS NULL OR f.version = v.version)
+  RETURNING f.id, f.layer_id, f.revision
+""")
 
 
 async def bulk_update_features(db: AsyncSession, updates: list[schemas.FeatureBulkUpdateItem]) -> tuple[int, list[int]]:
-  """Bulk update feature geometries in a single transaction.
+  """Bulk update feature geometries with a single UPDATE ... FROM unnest(...).
+  
+  Items with invalid rings, unknown ids or a stale version are reported,
+  the rest are written.
   
   Returns:
     tuple: (updated_count, failed_ids)
   """
-  updated_count = 0
   failed_ids = []
-  
+  # Keyed by id so a repeated id keeps its last geometry, as sequential updates did
+  rows: dict[int, tuple[str, float, float, int | None]] = {}
   for item in updates:
     try:
-      obj = await db.get(models.Feature, item.id)
-      if obj is None:
-        failed_ids.append(item.id)
-        continue
-      
-      ring = item.coordinates
-      if len(ring) < 3:
-        failed_ids.append(item.id)
-        continue
-      
-      # Ensure polygon is closed
-      if ring[0] != ring[-1]:
-        ring = ring + [ring[0]]
-      
-      wkt = 'POLYGON((' + ','.join(f"{x} {y}" for x, y in ring) + '))'
-      obj.geom = wkt
-      obj.x_coord = item.x_coord
-      obj.y_coord = item.y_coord
-      
-      updated_count += 1
-    except Exception as e:
+      _check_point(item.x_coord, item.y_coord)
+      rows[item.id] = (_polygon_wkt(item.coordinates), item.x_coord, item.y_coord, item.version)
+    except (ValueError, TypeError) as e:
       print(f"Failed to update feature {item.id}: {e}")
       failed_ids.append(item.id)
-  
+  if not rows:
+    return 0, failed_ids
+
+  result = await db.execute(BULK_UPDATE_SQL, {
+    "ids": list(rows),
+    "wkts": [wkt for wkt, _, _, _ in rows.values()],
+    "x_coords": [x for _, x, _, _ in rows.values()],
+    "y_coords": [y for _, _, y, _ in rows.values()],
+    "versions": [version for _, _, _, version in rows.values()],
+  })
+  updated = result.all()
+  updated_ids = {row.id for row in updated}
+  failed_ids += [feature_id for feature_id in rows if feature_id not in updated_ids]
+
   # Commit all updates in a single transaction
-  await db.commit()
-  return updated_count, failed_ids
\ No newline at end of file
+  await _finish_layer_write(
+    db, 'bulk_update', {row.layer_id: row.revision for row in updated}, [(row.id, row.layer_id) for row in updated]
+  )
+  return len(updated), failed_ids
+
+
+# Ids are drawn up front in `v` so every inserted row can be traced back to
+# its position in the batch; rows pointing at a missing layer or parent are
+# filtered there and unique conflicts are skipped, so the rest still load.
+BULK_CREATE_SQL = text("""
+  WITH v AS (
+    SELECT nextval(pg_get_serial_sequence('features', 'id')) AS id, v.*
+    FROM unnest(
+      CAST(:layer_ids AS integer[]), CAST(:parent_ids AS integer[]), CAST(:names AS text[]),
+      CAST(:opombas AS text[]), CAST(:colors AS text[]), CAST(:levels AS text[]),
+      CAST(:order_indexes AS integer[]), CAST(:depths AS integer[]), CAST(:properties AS text[]),
+      CAST(:wkts AS text[]), CAST(:x_coords AS double precision[]), CAST(:y_coords AS double precision[]),
+      CAST(:conas AS text[]), CAST(:max_capacities AS integer[]), CAST(:taken_capacities AS integer[]),
+      CAST(:positions AS integer[])
+    ) AS v(
+      layer_id, parent_id, name, opomba, color, level, order_index, depth, properties,
+      wkt, x_coord, y_coord, cona, max_capacity, taken_capacity, position
+    )
+    WHERE EXISTS (SELECT 1 FROM layers l WHERE l.id = v.layer_id)
+      AND (v.parent_id IS NULL OR EXISTS (SELECT 1 FROM features p WHERE p.id = v.parent_id))
+  ),
+  bumped AS (
+    UPDATE layers SET revision = revision + 1
+    WHERE id IN (SELECT layer_id FROM v)
+    RETURNING id, revision
+  ),
+  ins AS (
+    INSERT INTO features (
+      id, layer_id, parent_id, name, opomba, color, level, order_index, depth, properties,
+      geom, x_coord, y_coord, cona, max_capacity, taken_capacity, revision, updated_at
+    )
+    SELECT
+      v.id, v.layer_id, v.parent_id, v.name, v.opomba, v.color, v.level, v.order_index, v.depth,
+      CAST(v.properties AS jsonb), ST_GeomFromText(v.wkt, 3857), v.x_coord, v.y_coord,
+      v.cona, v.max_capacity, v.taken_capacity, bumped.revision, now()
+    FROM v JOIN bumped ON bumped.id = v.layer_id
+    ON CONFLICT DO NOTHING
+    RETURNING id, layer_id, revision
+  )
+  SELECT v.position, v.id AS planned_id, ins.id, ins.layer_id, ins.revision
+  FROM v LEFT JOIN ins ON ins.id = v.id
+""")
+
+
+async def bulk_create_features(
+  db: AsyncSession, items: list[tuple[int, schemas.FeatureCreate]]
+) -> tuple[list[tuple[int, int]], list[tuple[int, str]]]:
+  """Insert a batch of features with one multi-row INSERT ... SELECT FROM unnest(...).
+  
+  `items` are (position, feature) pairs; a bad item is reported against its
+  position instead of failing the batch.
+  
+  Returns:
+    tuple: (created [(position, id)], errors [(position, message)])
+  """
+  errors = []
+  rows = []
+  for position, data in items:
+    ring = data.coordinates
+    try:
+      wkt = _polygon_wkt(ring)
+      _check_integer_fields(data)
+    except (ValueError, TypeError) as e:
+      errors.append((position, str(e) or "Invalid coordinates"))
+      continue
+    rows.append({
+      "layer_ids": data.layer_id or 1,
+      "parent_ids": data.parent_id,
+      "names": data.name,
+      "opombas": data.opomba,
+      "colors": data.color,
+      "levels": data.level,
+      "order_indexes": data.order_index,
+      "depths": data.depth,
+      "properties": json.dumps(data.properties),
+      "wkts": wkt,
+      "x_coords": float(ring[0][0]),
+      "y_coords": float(ring[0][1]),
+      "conas": data.cona,
+      "max_capacities": data.max_capacity,
+      "taken_capacities": data.taken_capacity,
+      "positions": position,
+    })
+  if not rows:
+    return [], sorted(errors)
+
+  # One array per column for unnest()
+  result = await db.execute(BULK_CREATE_SQL, {key: [row[key] for row in rows] for key in rows[0]})
+  outcome = {row.position: row for row in result}
+  created = []
+  changed = []
+  revisions = {}
+  for row in rows:
+    position = row["positions"]
+    inserted = outcome.get(position)
+    if inserted is None:
+      errors.append((position, f"Unknown layer_id {row['layer_ids']} or parent_id {row['parent_ids']}"))
+    elif inserted.id is None:
+      errors.append((position, f"Feature with name '{row['names']}' already exists on layer {row['layer_ids']}"))
+    else:
+      created.append((position, inserted.id))
+      changed.append((inserted.id, inserted.layer_id))
+      revisions[inserted.layer_id] = inserted.revision
+
+  await _finish_layer_write(db, 'create', revisions, changed)
+  errors.sort()
+  return created, errors
+
+
+# Walks parent_id down from the roots, then deletes the whole subtree and
+# tombstones it at the owning layers' new revisions in the same statement.
+# `deleted` joins `bumped`, so the layer rows are locked before any feature
+# row, in the same order as every other writer.
+BULK_DELETE_SQL = text("""
+  WITH RECURSIVE subtree AS (
+    SELECT id, layer_id FROM features WHERE id = ANY(CAST(:root_ids AS integer[]))
+    UNION
+    SELECT f.id, f.layer_id FROM features f JOIN subtree s ON f.parent_id = s.id
+  ),
+  bumped AS (
+    UPDATE layers SET revision = revision + 1
+    WHERE id IN (SELECT layer_id FROM subtree)
+    RETURNING id, revision
+  ),
+  deleted AS (
+    DELETE FROM features f USING bumped b
+    WHERE f.id IN (SELECT id FROM subtree) AND f.layer_id = b.id
+    RETURNING f.id, f.layer_id, b.revision
+  ),
+  tombstones AS (
+    INSERT INTO feature_tombstones (feature_id, layer_id, revision)
+    SELECT id, layer_id, revision FROM deleted
+  )
+  SELECT id, layer_id, revision FROM deleted
+""")
+
+
+async def bulk_delete_features(db: AsyncSession, root_ids: Iterable[int]) -> list[int]:
+  """Delete the given features and all their descendants in one statement.
+  
+  Returns:
+    list: ids of every deleted feature
+  """
+  result = await db.execute(BULK_DELETE_SQL, {"root_ids": sorted(set(root_ids))})
+  deleted = result.all()
+  await _finish_layer_write(
+    db, 'delete', {row.layer_id: row.revision for row in deleted},
+    removed=[(row.id, row.layer_id) for row in deleted],
+  )
+  return [row.id for row in deleted]
+
+
+BULK_PATCH_FIELDS = ('color', 'layer_id', 'max_capacity', 'opomba')
+
+
+async def bulk_patch_features(db: AsyncSession, data: schemas.FeatureBulkPatch) -> tuple[int, list[int]]:
+  """Set the same attributes on every listed feature in one statement.
+  
+  Returns:
+    tuple: (updated_count, failed_ids)
+  """
+  payload = data.model_dump(exclude_unset=True, include=set(BULK_PATCH_FIELDS))
+  # layer_id is not nullable; None means "keep the current layer"
+  if payload.get('layer_id', 0) is None:
+    payload.pop('layer_id')
+  ids = list(dict.fromkeys(data.ids))
+  if not payload or not ids:
+    return 0, []
+
+  assignments = ', '.join(f"{field} = :{field}" for field in BULK_PATCH_FIELDS if field in payload)
+  result = await db.execute(
+    text(FEATURE_PATCH_SQL.format(assignments=assignments, columns="u.id, u.layer_id, u.revision")),
+    {"ids": ids, **payload, "layer_id": payload.get('layer_id'), "expected_version": None},
+  )
+  updated = result.all()
+  revisions = {}
+  for row in updated:
+    revisions[row.layer_id] = row.revision
+    revisions[row.old_layer_id] = row.old_revision
+  await _finish_layer_write(
+    db, 'update', revisions,
+    [(row.id, row.layer_id) for row in updated],
+    [(row.id, row.old_layer_id) for row in updated if row.old_layer_id != row.layer_id],
+  )
+  updated_ids = {row.id for row in updated}
+  return len(updated), [feature_id for feature_id in ids if feature_id not in updated_ids]
+
+
+# x' = c*(x - px) - s*(y - py) + px + dx, y' = s*(x - px) + c*(y - py) + py + dy
+# with c = scale*cos(angle), s = scale*sin(angle): ST_Affine for the rings,
+# the same arithmetic for x_coord/y_coord.
+TRANSFORM_SUBTREE_SQL = text("""
+  WITH RECURSIVE subtree AS (
+    SELECT id FROM features WHERE id = :root_id
+    UNION
+    SELECT f.id FROM features f JOIN subtree s ON f.parent_id = s.id
+  ),
+  m AS (
+    SELECT
+      COALESCE(CAST(:pivot_x AS double precision), ST_X(ST_Centroid(geom))) AS px,
+      COALESCE(CAST(:pivot_y AS double precision), ST_Y(ST_Centroid(geom))) AS py,
+      CAST(:scale AS double precision) * cos(radians(CAST(:angle AS double precision))) AS c,
+      CAST(:scale AS double precision) * sin(radians(CAST(:angle AS double precision))) AS s,
+      CAST(:dx AS double precision) AS dx,
+      CAST(:dy AS double precision) AS dy
+    FROM features WHERE id = :root_id
+  ),
+  bumped AS (
+    UPDATE layers SET revision = revision + 1
+    WHERE id IN (SELECT f.layer_id FROM features f JOIN subtree t ON t.id = f.id)
+    RETURNING id, revision
+  )
+  UPDATE features f
+  SET geom = ST_Affine(
+        f.geom, m.c, -m.s, m.s, m.c,
+        m.px - m.c * m.px + m.s * m.py + m.dx,
+        m.py - m.s * m.px - m.c * m.py + m.dy
+      ),
+      x_coord = m.c * (f.x_coord - m.px) - m.s * (f.y_coord - m.py) + m.px + m.dx,
+      y_coord = m.s * (f.x_coord - m.px) + m.c * (f.y_coord - m.py) + m.py + m.dy,
+      revision = b.revision,
+      updated_at = now(),
+      version = f.version + 1
+  FROM subtree t, m, bumped b
+  WHERE f.id = t.id AND b.id = f.layer_id
+  RETURNING f.id, f.layer_id, f.revision
+""")
+
+
+async def transform_subtree(db: AsyncSession, root_id: int, transform: schemas.FeatureTransform) -> list[int] | None:
+  """Scale, rotate and translate a feature and all its descendants in one statement.
+  
+  Returns:
+    list: ids of the moved features, or None if the root does not exist
+  """
+  pivot_x, pivot_y = transform.pivot if transform.pivot is not None else (None, None)
+  result = await db.execute(TRANSFORM_SUBTREE_SQL, {
+    "root_id": root_id,
+    "dx": transform.dx,
+    "dy": transform.dy,
+    "angle": transform.angle,
+    "scale": transform.scale,
+    "pivot_x": pivot_x,
+    "pivot_y": pivot_y,
+  })
+  moved = result.all()
+  if not moved:
+    await db.rollback()
+    return None
+  await _finish_layer_write(
+    db, 'update', {row.layer_id: row.revision for row in moved}, [(row.id, row.layer_id) for row in moved]
+  )
+  return [row.id for row in moved]
+
+
+# Each event's delta is applied to its feature and every ancestor along
+# parent_id; deltas meeting on a shared ancestor are summed so each row is
+# updated once, atomically with the layer revision bump. A decrement that
+# would take any row of its chain below zero is rejected (dropping only
+# decrements can't push another row negative) and comes back as a
+# `rejected` row instead. The chain rows are locked after the layers (the
+# order every writer uses) and checked at their latest committed value, so
+# concurrent decrements see each other. `version` is left alone, as in
+# SYNC_TAKEN_CAPACITY_SQL.
+ADJUST_CAPACITY_SQL = text("""
+  WITH RECURSIVE ev AS (
+    SELECT id, sum(delta) AS delta
+    FROM unnest(CAST(:ids AS integer[]), CAST(:deltas AS integer[])) AS e(id, delta)
+    GROUP BY id
+  ),
+  chain AS (
+    SELECT ev.id AS event_id, f.id, f.parent_id, ev.delta, 0 AS hops
+    FROM features f JOIN ev ON ev.id = f.id
+    UNION ALL
+    SELECT c.event_id, p.id, p.parent_id, c.delta, c.hops + 1
+    FROM features p JOIN chain c ON p.id = c.parent_id
+    WHERE c.hops < :max_hops
+  ),
+  bumped AS (
+    UPDATE layers SET revision = revision + 1
+    WHERE id IN (SELECT f.layer_id FROM features f JOIN chain c ON c.id = f.id)
+    RETURNING id, revision
+  ),
+  locked AS (
+    SELECT f.id, f.taken_capacity
+    FROM features f
+    WHERE f.id IN (SELECT id FROM chain) AND f.layer_id IN (SELECT id FROM bumped)
+    FOR UPDATE
+  ),
+  rejected AS (
+    SELECT DISTINCT c.event_id AS id
+    FROM chain c
+    JOIN (SELECT id, sum(delta) AS delta FROM chain GROUP BY id) t ON t.id = c.id
+    JOIN locked l ON l.id = c.id
+    WHERE c.delta < 0 AND COALESCE(l.taken_capacity, 0) + t.delta < 0
+  ),
+  totals AS (
+    SELECT id, sum(delta) AS delta FROM chain
+    WHERE event_id NOT IN (SELECT id FROM rejected)
+    GROUP BY id
+  ),
+  updated AS (
+    UPDATE features f
+    SET taken_capacity = COALESCE(f.taken_capacity, 0) + t.delta,
+        revision = b.revision,
+        updated_at = now()
+    FROM totals t, bumped b
+    WHERE f.id = t.id AND b.id = f.layer_id
+    RETURNING f.id, f.layer_id, f.revision, f.taken_capacity, f.max_capacity
+  )
+  SELECT *, false AS rejected FROM updated
+  UNION ALL
+  SELECT id, NULL, NULL, NULL, NULL, true FROM rejected
+""")
+
+# Guards the parent_id walk against cycles; polje/subzone/vrsta/globina is 4 deep
+MAX_CAPACITY_HOPS = 32
+
+
+async def adjust_capacity(db: AsyncSession, events: list[schemas.FeatureCapacityDelta]) -> tuple[list, list[int]]:
+  """Add each delta to its feature's taken_capacity and all its ancestors' in one statement.
+  
+  Returns:
+    tuple: (updated rows, failed_ids of unknown features and of decrements below zero)
+  """
+  if not events:
+    return [], []
+  result = await db.execute(ADJUST_CAPACITY_SQL, {
+    "ids": [event.id for event in events],
+    "deltas": [event.delta for event in events],
+    "max_hops": MAX_CAPACITY_HOPS,
+  })
+  rows = result.all()
+  updated = [row for row in rows if not row.rejected]
+  rejected_ids = {row.id for row in rows if row.rejected}
+  await _finish_layer_write(
+    db, 'update', {row.layer_id: row.revision for row in updated}, [(row.id, row.layer_id) for row in updated]
+  )
+  updated_ids = {row.id for row in updated}
+  failed_ids = list(dict.fromkeys(
+    event.id for event in events if event.id in rejected_ids or event.id not in updated_ids
+  ))
+  return updated, failed_ids
+
+
+# Container count prefix each feature level is matched on: polje by 4,
+# subzone by 5, vrsta by 6 characters of "Odlagalna cona", others exactly (0)
+LEVEL_PREFIX_LEN = "CASE f.level WHEN 'polje' THEN 4 WHEN 'subzone' THEN 5 WHEN 'vrsta' THEN 6 ELSE 0 END"
+
+# Only rows whose count differs are written (a NULL taken_capacity counts as
+# 0), so an unchanged floor costs no writes, revisions or notifications.
+# Counter-only writes leave `version` alone, so they never make a client's
+# pending geometry or attribute edit stale.
+SYNC_TAKEN_CAPACITY_SQL = text(f"""
+  WITH counts AS (
+    SELECT *
+    FROM unnest(
+      CAST(:prefix_lens AS integer[]), CAST(:cona_keys AS text[]), CAST(:counts AS bigint[])
+    ) AS c(prefix_len, cona_key, zabojniki_count)
+  ),
+  changed AS (
+    SELECT f.id, f.layer_id, COALESCE(c.zabojniki_count, 0) AS taken_capacity
+    FROM features f
+    LEFT JOIN counts c
+      ON c.prefix_len = {LEVEL_PREFIX_LEN}
+      AND c.cona_key = CASE c.prefix_len WHEN 0 THEN f.cona ELSE LEFT(f.cona, c.prefix_len) END
+    WHERE f.cona IS NOT NULL
+      AND COALESCE(f.taken_capacity, 0) <> COALESCE(c.zabojniki_count, 0)
+  ),
+  bumped AS (
+    UPDATE layers SET revision = revision + 1
+    WHERE id IN (SELECT layer_id FROM changed)
+    RETURNING id, revision
+  )
+  UPDATE features f
+  SET taken_capacity = c.taken_capacity,
+      revision = b.revision,
+      updated_at = now()
+  FROM changed c, bumped b
+  WHERE f.id = c.id AND b.id = f.layer_id
+  RETURNING f.id, f.layer_id, f.revision
+""")
+
+
+async def sync_taken_capacity(db: AsyncSession, counts: list) -> int:
+  """Set taken_capacity from (prefix_len, cona_key, zabojniki_count) container counts; returns rows changed."""
+  result = await db.execute(SYNC_TAKEN_CAPACITY_SQL, {
+    "prefix_lens": [row.prefix_len for row in counts],
+    "cona_keys": [row.cona_key for row in counts],
+    "counts": [row.zabojniki_count for row in counts],
+  })
+  changed = result.all()
+  if not changed:
+    await db.rollback()
+    return 0
+  await _finish_layer_write(
+    db, 'occupancy', {row.layer_id: row.revision for row in changed}, [(row.id, row.layer_id) for row in changed]
+  )
+  return len(changed)
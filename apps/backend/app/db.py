@@ -8,11 +8,30 @@ class Base(DeclarativeBase):
   pass
 
 
-engine: AsyncEngine = create_async_engine(settings.async_database_url, echo=False, pool_pre_ping=True)
+engine: AsyncEngine = create_async_engine(
+  settings.async_database_url,
+  echo=False,
+  pool_pre_ping=True,
+  pool_size=settings.db_pool_size,
+  max_overflow=settings.db_max_overflow,
+  pool_timeout=settings.db_pool_timeout,
+  pool_recycle=settings.db_pool_recycle,
+)
 SessionLocal = async_sessionmaker(engine, expire_on_commit=False)
 
+# Source database with the live container tables (advanced search); read only
+source_engine: AsyncEngine = create_async_engine(
+  settings.source_async_database_url,
+  echo=False,
+  pool_pre_ping=True,
+  pool_size=settings.source_db_pool_size,
+  max_overflow=settings.source_db_max_overflow,
+  pool_timeout=settings.db_pool_timeout,
+  pool_recycle=settings.db_pool_recycle,
+)
+SourceSessionLocal = async_sessionmaker(source_engine, expire_on_commit=False)
+
 
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
   async with SessionLocal() as session:
     yield session
-
@@ -0,0 +1,101 @@
+import asyncio
+import json
+from typing import Optional
+import asyncpg
+from .cache import snapshot_cache
+from .config import settings
+
+# Postgres NOTIFY channel written by crud._finish_layer_write (and crud.record_layer_rewrite)
+CHANNEL = 'feature_changes'
+# NOTIFY payloads must stay under 8000 bytes; past this many ids clients resync via /features/changes
+MAX_EVENT_IDS = 500
+RECONNECT_DELAY_SECONDS = 5
+
+
+def change_event(
+  layer_id: int, revision: int, op: str, changed: Optional[list[int]], deleted: Optional[list[int]]
+) -> str:
+  """Compact JSON payload of one layer's write, as sent through NOTIFY.
+
+  Without id lists (None, or too many ids) clients resync via /features/changes.
+  """
+  event = {"layer_id": layer_id, "revision": revision, "op": op, "changed": changed, "deleted": deleted}
+  if changed is None or deleted is None or len(changed) + len(deleted) > MAX_EVENT_IDS:
+    event["changed"] = event["deleted"] = None
+  return json.dumps(event, separators=(',', ':'))
+
+
+class Subscription:
+  def __init__(self, layer_id: Optional[int]):
+    self.layer_id = layer_id
+    self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=100)
+
+  def push(self, event: dict) -> None:
+    if self.layer_id is not None and event.get("layer_id") not in (None, self.layer_id):
+      return
+    try:
+      self.queue.put_nowait(event)
+    except asyncio.QueueFull:
+      # Slow consumer: drop the backlog and tell it to refetch instead
+      while not self.queue.empty():
+        self.queue.get_nowait()
+      self.queue.put_nowait({"op": "resync", "layer_id": self.layer_id})
+
+
+class FeatureEventHub:
+  """
+  One LISTEN connection per process, fanned out to in-process subscribers.
+  Events also invalidate the snapshot cache, so writes made by other
+  processes (or other workers) are picked up too.
+  """
+
+  def __init__(self):
+    self._subscriptions: set[Subscription] = set()
+    self.connected = False
+
+  def subscribe(self, layer_id: Optional[int]) -> Subscription:
+    subscription = Subscription(layer_id)
+    self._subscriptions.add(subscription)
+    return subscription
+
+  def unsubscribe(self, subscription: Subscription) -> None:
+    self._subscriptions.discard(subscription)
+
+  def _broadcast(self, event: dict) -> None:
+    for subscription in list(self._subscriptions):
+      subscription.push(event)
+
+  def _on_notify(self, connection, pid, channel, payload) -> None:
+    try:
+      event = json.loads(payload)
+    except ValueError:
+      print(f"Ignoring malformed {CHANNEL} payload: {payload!r}")
+      return
+    snapshot_cache.invalidate_layers([event["layer_id"]])
+    self._broadcast(event)
+
+  async def run(self) -> None:
+    """Listen forever, reconnecting after connection loss."""
+    while True:
+      connection = None
+      try:
+        connection = await asyncpg.connect(settings.listen_dsn)
+        closed = asyncio.Event()
+        connection.add_termination_listener(lambda _: closed.set())
+        await connection.add_listener(CHANNEL, self._on_notify)
+        self.connected = True
+        # Anything sent while we were not listening is lost
+        snapshot_cache.clear()
+        self._broadcast({"op": "resync", "layer_id": None})
+        await closed.wait()
+      except asyncio.CancelledError:
+        if connection is not None:
+          await connection.close()
+        raise
+      except Exception as e:
+        print(f"Feature change listener failed: {e}")
+      self.connected = False
+      await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+
+feature_events = FeatureEventHub()
@@ -0,0 +1,89 @@
+import asyncio
+import gzip
+import hashlib
+from typing import Iterable
+from fastapi import Request, Response
+from .cache import CacheEntry
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+# Below this, compression costs more than it saves (same as nginx gzip_min_length)
+MIN_COMPRESS_SIZE = 1024
+
+
+def make_etag(*parts) -> str:
+  """Weak ETag from revision parts, e.g. make_etag('layer', 3, 'r', 17) -> W/"layer-3-r-17"."""
+  return 'W/"' + '-'.join(str(p) for p in parts) + '"'
+
+
+def fingerprint(values: Iterable) -> str:
+  """Short stable digest for ETags that cover several rows (all layers etc.)."""
+  digest = hashlib.md5(repr(list(values)).encode('utf-8')).hexdigest()
+  return digest[:16]
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+  """Weak comparison of If-None-Match against our ETag (RFC 9110 13.1.2)."""
+  header = request.headers.get('if-none-match')
+  if not header:
+    return False
+  if header.strip() == '*':
+    return True
+  ours = etag.removeprefix('W/')
+  return any(tag.strip().removeprefix('W/') == ours for tag in header.split(','))
+
+
+def not_modified(etag: str) -> Response:
+  return Response(status_code=304, headers=cache_headers(etag))
+
+
+def cache_headers(etag: str) -> dict[str, str]:
+  # no-cache: clients may keep the body but must revalidate with If-None-Match
+  return {'ETag': etag, 'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+
+
+def preferred_encoding(request: Request) -> str | None:
+  """Pick br or gzip from Accept-Encoding (honouring q=0), br first when available."""
+  accepted = set()
+  for part in request.headers.get('accept-encoding', '').split(','):
+    coding, _, params = part.strip().partition(';')
+    q = params.strip().removeprefix('q=') if params.strip().startswith('q=') else '1'
+    try:
+      if float(q) > 0:
+        accepted.add(coding.strip().lower())
+    except ValueError:
+      continue
+  if brotli is not None and 'br' in accepted:
+    return 'br'
+  if 'gzip' in accepted:
+    return 'gzip'
+  return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+  # Paid once per cached payload and revision, so favour ratio over speed
+  if encoding == 'br':
+    return brotli.compress(body, quality=9)
+  return gzip.compress(body, compresslevel=9)
+
+
+async def entry_response(request: Request, entry: CacheEntry) -> Response:
+  """
+  Serve a serialized payload, or 304 if the client already has it.
+  Compressed variants are produced once per entry and kept on it, so every
+  later request with the same Accept-Encoding gets the stored bytes.
+  """
+  if etag_matches(request, entry.etag):
+    return not_modified(entry.etag)
+  headers = cache_headers(entry.etag)
+  encoding = preferred_encoding(request) if len(entry.body) >= MIN_COMPRESS_SIZE else None
+  if encoding is None:
+    return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+  body = entry.encoded.get(encoding)
+  if body is None:
+    body = await asyncio.to_thread(compress, entry.body, encoding)
+    entry.encoded[encoding] = body
+  headers['Content-Encoding'] = encoding
+  return Response(content=body, media_type=entry.media_type, headers=headers)
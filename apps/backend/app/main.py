@@ -1,10 +1,43 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import layers, features
+from fastapi.middleware.gzip import GZipMiddleware
+from .routers import layers, features, features_v2, cache
 from .api import advanced_search
 from .config import settings
+from .events import feature_events
+from .write_queue import geometry_write_queue
+from .mirror import container_mirror
+from .occupancy import occupancy_sync
 
-app = FastAPI(title='Factory Map Backend')
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Postgres LISTEN for feature change push (SSE) and cross-process cache invalidation
+    listener = asyncio.create_task(feature_events.run())
+    # Periodic flush of deferred geometry PATCHes
+    flusher = asyncio.create_task(geometry_write_queue.run())
+    tasks = [listener, flusher]
+    # Refresh of the local container mirror advanced search reads
+    if settings.container_mirror_interval_seconds > 0:
+        tasks.append(asyncio.create_task(container_mirror.run()))
+    # Live container counts into features.taken_capacity
+    if settings.occupancy_sync_interval_seconds > 0:
+        tasks.append(asyncio.create_task(occupancy_sync.run()))
+    yield
+    for task in tasks:
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
+    # Deferred edits still queued
+    try:
+        await geometry_write_queue.flush()
+    except Exception:
+        pass  # Logged by the queue; nothing left to retry with
+
+
+app = FastAPI(title='Factory Map Backend', lifespan=lifespan)
 
 @app.get("/health")
 async def health_check():
@@ -14,7 +47,10 @@ async def health_check():
         "mode": "development" if settings.dev_mode else "production",
         "backend_port": settings.backend_port,
         "frontend_port": settings.frontend_port,
-        "database_host": settings.pg_host
+        "database_host": settings.pg_host,
+        "feature_events_connected": feature_events.connected,
+        "container_mirror": container_mirror.stats(),
+        "occupancy_sync": occupancy_sync.stats()
     }
 
 # CORS configuration
@@ -39,10 +75,18 @@ app.add_middleware(
     allow_credentials=allow_credentials,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the viewer read revalidation and pagination headers
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
+# Compresses responses that are not served pre-compressed from the snapshot
+# cache (streamed lists, pages, advanced search); it leaves responses that
+# already carry Content-Encoding alone
+app.add_middleware(GZipMiddleware, minimum_size=1024)
 
 app.include_router(layers.router, prefix="/api")
 app.include_router(features.router, prefix="/api")
+app.include_router(features_v2.router, prefix="/api/v2")
+app.include_router(cache.router, prefix="/api")
 app.include_router(advanced_search.router, prefix="/api", tags=["advanced-search"])
 
 
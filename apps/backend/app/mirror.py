@@ -0,0 +1,128 @@
+import asyncio
+import time
+from typing import Optional
+from sqlalchemy import text
+from .cache import annotations_cache
+from .config import settings
+from .db import engine, source_engine, SessionLocal, SourceSessionLocal
+
+SOURCE_TABLE = 'zabojniki_proizvodnje_tisna5237_aktivni'
+MIRROR_TABLE = 'zabojniki_aktivni_mirror'
+MIRROR_COLUMNS = (
+  'Odlagalna cona', 'Operacija', 'Status', 'Artikel', 'Dodatna oznaka zabojnika', 'Nalog', 'ONK',
+)
+COPY_CHUNK_ROWS = 5000
+# Each refresh loads a fresh table and renames it over the mirror, so no
+# dead tuples or index bloat pile up and searches never wait on the load
+STAGING_TABLE = f'{MIRROR_TABLE}_staging'
+# Built after the load (cheaper than maintaining them during COPY) and
+# renamed along with the table; same definitions as migration a61c5e8d2b47
+MIRROR_INDEXES = (
+  ('idx_zabojniki_mirror_cona_operacija', 'btree ("Odlagalna cona" text_pattern_ops, "Operacija")'),
+  ('idx_zabojniki_mirror_artikel_trgm', 'gin ("Artikel" gin_trgm_ops)'),
+  ('idx_zabojniki_mirror_nalog_trgm', 'gin ("Nalog" gin_trgm_ops)'),
+  ('idx_zabojniki_mirror_onk_trgm', 'gin ("ONK" gin_trgm_ops)'),
+  ('idx_zabojniki_mirror_dodatna_trgm', 'gin ("Dodatna oznaka zabojnika" gin_trgm_ops)'),
+)
+# The swap needs an exclusive lock on the mirror; give up (and retry next
+# tick) rather than queue searches behind a long-running one
+SWAP_LOCK_TIMEOUT = '5s'
+
+# Where container queries (advanced search, occupancy sync) read from; the
+# mirror has trigram/btree indexes for the search's LIKE filters
+CONTAINER_TABLE = MIRROR_TABLE if settings.search_use_mirror else SOURCE_TABLE
+ContainerSessionLocal = SessionLocal if settings.search_use_mirror else SourceSessionLocal
+# Advisory lock serializing syncs across workers; two concurrent rebuilds
+# would otherwise collide on the staging table
+SYNC_LOCK_KEY = 724_051_001
+
+# Casts pin the types COPY expects, whatever the source declares
+SOURCE_SELECT = text(f"""
+  SELECT
+    CAST("Odlagalna cona" AS text), CAST("Operacija" AS integer), CAST("Status" AS text),
+    CAST("Artikel" AS text), CAST("Dodatna oznaka zabojnika" AS text), CAST("Nalog" AS text), CAST("ONK" AS text)
+  FROM {SOURCE_TABLE}
+""")
+
+
+async def sync_container_mirror() -> Optional[int]:
+  """
+  Replace the mirror with the source table's current rows; returns the row
+  count, or None if another process is syncing right now.
+
+  Runs as one transaction on our side: COPY in chunks straight from a
+  server-side cursor into a new staging table, index and analyze it, then
+  drop the mirror and rename the staging table over it. Searches keep
+  reading the previous table until the commit and only wait for the swap.
+  """
+  rows = 0
+  async with source_engine.connect() as source, engine.begin() as target:
+    if not await target.scalar(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": SYNC_LOCK_KEY}):
+      return None
+    await target.execute(text(f"DROP TABLE IF EXISTS {STAGING_TABLE}"))
+    await target.execute(text(f"CREATE TABLE {STAGING_TABLE} (LIKE {MIRROR_TABLE} INCLUDING DEFAULTS)"))
+    result = await source.stream(SOURCE_SELECT)
+    raw = (await target.get_raw_connection()).driver_connection
+    async for partition in result.partitions(COPY_CHUNK_ROWS):
+      await raw.copy_records_to_table(STAGING_TABLE, records=[tuple(row) for row in partition], columns=MIRROR_COLUMNS)
+      rows += len(partition)
+    for name, definition in MIRROR_INDEXES:
+      await target.execute(text(f"CREATE INDEX {name}_staging ON {STAGING_TABLE} USING {definition}"))
+    await target.execute(text(f"ANALYZE {STAGING_TABLE}"))
+
+    await target.execute(text(f"SET LOCAL lock_timeout = '{SWAP_LOCK_TIMEOUT}'"))
+    await target.execute(text(f"DROP TABLE {MIRROR_TABLE}"))
+    await target.execute(text(f"ALTER TABLE {STAGING_TABLE} RENAME TO {MIRROR_TABLE}"))
+    for name, _ in MIRROR_INDEXES:
+      await target.execute(text(f"ALTER INDEX {name}_staging RENAME TO {name}"))
+  # Cached searches were computed from the previous snapshot
+  annotations_cache.clear()
+  return rows
+
+
+class ContainerMirrorSync:
+  """Periodic refresh of the container mirror, started from the app lifespan."""
+
+  def __init__(self, interval_seconds: float):
+    self.interval = interval_seconds
+    self.rows: Optional[int] = None
+    self.synced_at: Optional[float] = None
+    self.last_duration_ms: Optional[float] = None
+    self.last_error: Optional[str] = None
+
+  async def sync(self) -> Optional[int]:
+    started = time.perf_counter()
+    try:
+      rows = await sync_container_mirror()
+    except Exception as e:
+      self.last_error = str(e)
+      print(f"Container mirror sync failed: {e}")
+      raise
+    if rows is None:
+      return None  # Another worker did it
+    self.rows = rows
+    self.synced_at = time.time()
+    self.last_duration_ms = (time.perf_counter() - started) * 1000
+    self.last_error = None
+    return rows
+
+  async def run(self) -> None:
+    """Sync now, then every interval, until cancelled."""
+    while True:
+      try:
+        await self.sync()
+      except Exception:
+        pass  # Recorded in last_error; retried on the next tick
+      await asyncio.sleep(self.interval)
+
+  def stats(self) -> dict:
+    return {
+      "interval_seconds": self.interval,
+      "rows": self.rows,
+      "synced_at": self.synced_at,
+      "last_duration_ms": self.last_duration_ms,
+      "last_error": self.last_error,
+    }
+
+
+container_mirror = ContainerMirrorSync(settings.container_mirror_interval_seconds)
@@ -1,6 +1,7 @@
 from typing import List, Optional
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Integer, Boolean, ForeignKey, JSON, Float
+from datetime import datetime
+from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, JSON, Float, DateTime, Table, func
 from geoalchemy2 import Geometry
 from .db import Base
 
@@ -14,6 +15,8 @@ class Layer(Base):
   z_index: Mapped[int] = mapped_column(Integer, default=0)
   visible: Mapped[bool] = mapped_column(Boolean, default=True)
   editable: Mapped[bool] = mapped_column(Boolean, default=True)
+  # Incremented on every feature write on this layer (ETags, change tracking)
+  revision: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
 
   features: Mapped[List['Feature']] = relationship(back_populates='layer', cascade='all, delete-orphan')
 
@@ -39,6 +42,37 @@ class Feature(Base):
   cona: Mapped[Optional[str]] = mapped_column(String, nullable=True)
   max_capacity: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
   taken_capacity: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+  # Layer revision of the last write to this row (delta sync)
+  revision: Mapped[int] = mapped_column(Integer, default=0, server_default='0')
+  updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+  # Incremented on every write to this row (optimistic concurrency)
+  version: Mapped[int] = mapped_column(Integer, default=1, server_default='1')
 
   layer: Mapped['Layer'] = relationship(back_populates='features')
-  parent: Mapped[Optional['Feature']] = relationship(remote_side=[id])
\ No newline at end of file
+  parent: Mapped[Optional['Feature']] = relationship(remote_side=[id])
+
+
+class FeatureTombstone(Base):
+  """A feature that left a layer (deleted or moved) at the given layer revision."""
+  __tablename__ = 'feature_tombstones'
+
+  id: Mapped[int] = mapped_column(primary_key=True)
+  feature_id: Mapped[int] = mapped_column(Integer)
+  layer_id: Mapped[int] = mapped_column(ForeignKey('layers.id', ondelete='CASCADE'))
+  revision: Mapped[int] = mapped_column(Integer)
+  deleted_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+
+# Local copy of the source zabojniki_proizvodnje_tisna5237_aktivni columns
+# advanced search filters on. No primary key: app/mirror.py rebuilds it and
+# swaps it in whole on every refresh.
+active_container_mirror = Table(
+  'zabojniki_aktivni_mirror', Base.metadata,
+  Column('Odlagalna cona', String, nullable=True),
+  Column('Operacija', Integer, nullable=True),
+  Column('Status', String, nullable=True),
+  Column('Artikel', String, nullable=True),
+  Column('Dodatna oznaka zabojnika', String, nullable=True),
+  Column('Nalog', String, nullable=True),
+  Column('ONK', String, nullable=True),
+)
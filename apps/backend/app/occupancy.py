@@ -0,0 +1,108 @@
+import asyncio
+import time
+from typing import Optional
+from sqlalchemy import text
+from . import crud
+from .config import settings
+from .db import SessionLocal, SourceSessionLocal
+from .mirror import SOURCE_TABLE
+
+
+def cona_counts_sql(table: str, where_clause: str = "") -> str:
+  """
+  Container counts per exact "Odlagalna cona" and per 4-, 5- and 6-character
+  prefix in one pass. prefix_len says which grouping set a row belongs to
+  (0 = exact cona); cona_key is NULL only for containers without a cona.
+  """
+  return f"""
+    SELECT
+      CASE
+        WHEN GROUPING("Odlagalna cona") = 0 THEN 0
+        WHEN GROUPING(LEFT("Odlagalna cona", 6)) = 0 THEN 6
+        WHEN GROUPING(LEFT("Odlagalna cona", 5)) = 0 THEN 5
+        ELSE 4
+      END as prefix_len,
+      COALESCE(
+        "Odlagalna cona",
+        LEFT("Odlagalna cona", 6),
+        LEFT("Odlagalna cona", 5),
+        LEFT("Odlagalna cona", 4)
+      ) as cona_key,
+      COUNT(*) as zabojniki_count
+    FROM {table}
+    {where_clause}
+    GROUP BY GROUPING SETS (
+      ("Odlagalna cona"),
+      (LEFT("Odlagalna cona", 4)),
+      (LEFT("Odlagalna cona", 5)),
+      (LEFT("Odlagalna cona", 6))
+    )
+  """
+
+
+async def sync_occupancy() -> int:
+  """Write live container counts into features.taken_capacity; returns the number of rows changed.
+
+  Counted on the source table itself: the search mirror lags by up to
+  CONTAINER_MIRROR_INTERVAL_SECONDS, and one grouped count is cheap.
+  """
+  async with SourceSessionLocal() as source_db:
+    result = await source_db.execute(text(cona_counts_sql(SOURCE_TABLE)))
+    counts = [row for row in result if row.cona_key is not None]
+  if not counts:
+    # An empty result (e.g. the source being reloaded) would zero the whole floor
+    return 0
+  async with SessionLocal() as db:
+    return await crud.sync_taken_capacity(db, counts)
+
+
+class OccupancySync:
+  """Periodic occupancy refresh, started from the app lifespan."""
+
+  def __init__(self, interval_seconds: float):
+    self.interval = interval_seconds
+    self.runs = 0
+    self.changed = 0
+    self.synced_at: Optional[float] = None
+    self.last_changed: Optional[int] = None
+    self.last_duration_ms: Optional[float] = None
+    self.last_error: Optional[str] = None
+
+  async def sync(self) -> int:
+    started = time.perf_counter()
+    try:
+      changed = await sync_occupancy()
+    except Exception as e:
+      self.last_error = str(e)
+      print(f"Occupancy sync failed: {e}")
+      raise
+    self.runs += 1
+    self.changed += changed
+    self.last_changed = changed
+    self.synced_at = time.time()
+    self.last_duration_ms = (time.perf_counter() - started) * 1000
+    self.last_error = None
+    return changed
+
+  async def run(self) -> None:
+    """Sync now, then every interval, until cancelled."""
+    while True:
+      try:
+        await self.sync()
+      except Exception:
+        pass  # Recorded in last_error; retried on the next tick
+      await asyncio.sleep(self.interval)
+
+  def stats(self) -> dict:
+    return {
+      "interval_seconds": self.interval,
+      "runs": self.runs,
+      "changed": self.changed,
+      "last_changed": self.last_changed,
+      "synced_at": self.synced_at,
+      "last_duration_ms": self.last_duration_ms,
+      "last_error": self.last_error,
+    }
+
+
+occupancy_sync = OccupancySync(settings.occupancy_sync_interval_seconds)
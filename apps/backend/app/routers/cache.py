@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from ..cache import annotations_cache, snapshot_cache
+
+
+router = APIRouter(prefix='/cache', tags=['cache'])
+
+
+@router.get('/stats')
+async def get_cache_stats():
+  """Hit/miss counters and size of the in-process caches."""
+  return {"snapshot": snapshot_cache.stats(), "advanced_search": annotations_cache.stats()}
+
+
+@router.post('/clear')
+async def clear_cache():
+  """Drop every cached payload, e.g. after a populate script rewrote the tables."""
+  snapshot_cache.clear()
+  annotations_cache.clear()
+  return {"ok": True}
@@ -1,171 +1,738 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import AsyncIterator, Awaitable, Callable
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import TypeAdapter, ValidationError
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
-from ..db import get_db
+from ..db import SessionLocal, get_db
+from ..cache import CacheEntry, snapshot_cache
+from ..config import settings
+from ..events import feature_events
+from ..write_queue import geometry_write_queue
+from ..http_cache import make_etag, fingerprint, etag_matches, not_modified, cache_headers, entry_response
 from .. import crud, schemas
+import asyncio
+import base64
 import json
+import math
 
 
 router = APIRouter(prefix='/features', tags=['features'])
 
+FEATURE_ADAPTER = TypeAdapter(schemas.FeatureRead)
+
+MAX_PAGE_SIZE = 5000
+MAX_BULK_CREATE = 10000
+STREAM_CHUNK_ROWS = 500
+
+GEOJSON_PROPERTY_COLUMNS = (
+  'id', 'layer_id', 'parent_id', 'name', 'opomba', 'color', 'level',
+  'order_index', 'depth', 'cona', 'max_capacity', 'taken_capacity', 'version',
+)
+# `properties` selects the free-form JSON merged into GeoJSON properties
+GEOJSON_FIELDS = GEOJSON_PROPERTY_COLUMNS + ('properties',)
+FEATURE_FIELDS = tuple(schemas.FeatureRead.model_fields)
+
+FIELDS_DESCRIPTION = "Comma-separated subset of fields to return (id is always included)"
+
+
+def _parse_fields(fields: str | None, allowed: tuple[str, ...]) -> tuple[str, ...]:
+  """Validate a fields= projection; the result keeps the canonical field order."""
+  if fields is None:
+    return allowed
+  requested = {name.strip() for name in fields.split(',') if name.strip()}
+  unknown = requested - set(allowed)
+  if unknown:
+    raise HTTPException(
+      status_code=400,
+      detail=f"Unknown fields: {', '.join(sorted(unknown))}. Allowed: {', '.join(allowed)}",
+    )
+  requested.add('id')
+  return tuple(name for name in allowed if name in requested)
+
+
+def _geojson_feature_sql(geometry: str = "ST_AsGeoJSON(geom)", fields: tuple[str, ...] = GEOJSON_FIELDS) -> str:
+  """
+  One GeoJSON Feature per row, matching the shape the viewer has always read:
+  the typed columns first, then the free-form `properties` merged on top
+  (keys in `properties` win, as with `{**columns, **properties}`).
+  `fields` narrows the properties to the selected columns.
+  """
+  columns = ",\n            ".join(f"'{name}', {name}" for name in GEOJSON_PROPERTY_COLUMNS if name in fields)
+  merged = ""
+  if 'properties' in fields:
+    merged = " || COALESCE(NULLIF(properties::jsonb, 'null'::jsonb), '{}'::jsonb)"
+  return f"""json_build_object(
+        'type', 'Feature',
+        'geometry', {geometry}::json,
+        'properties', jsonb_build_object(
+            {columns}
+        ){merged}
+    )"""
+
+
+# Stored rings are longitude/latitude values, so simplification tolerances are
+# in degrees: one 512px MapLibre tile spans 360 degrees at zoom 0.
+DEGREES_PER_PIXEL_Z0 = 360 / 512
+
+
+def _simplify_tolerance(zoom: float | None, tolerance: float | None) -> float | None:
+  """Explicit tolerance wins; otherwise one screen pixel at the zoom bucket (floor of zoom)."""
+  if tolerance is not None:
+    return tolerance
+  if zoom is None:
+    return None
+  return DEGREES_PER_PIXEL_Z0 / 2 ** math.floor(zoom)
+
+
+BBOX_DESCRIPTION = (
+  "minLon,minLat,maxLon,maxLat, as returned by MapLibre getBounds(); geom holds lon/lat "
+  "values as stored (tagged SRID 3857), so no reprojection is applied"
+)
+
+
+def _parse_bbox(bbox: str | None) -> tuple[float, float, float, float] | None:
+  if bbox is None:
+    return None
+  try:
+    minx, miny, maxx, maxy = (float(v) for v in bbox.split(','))
+  except ValueError:
+    raise HTTPException(status_code=400, detail=f"bbox must be {BBOX_DESCRIPTION}")
+  if minx > maxx or miny > maxy:
+    raise HTTPException(status_code=400, detail="bbox min values must not exceed max values")
+  return minx, miny, maxx, maxy
+
+
+def feature_filters(
+  layer_id: int | None, bbox: str | None, after: tuple[int | None, int] | None = None
+) -> tuple[str, dict]:
+  """WHERE clause and params shared by the feature read endpoints."""
+  where_clauses = []
+  params = {}
+  if layer_id is not None:
+    where_clauses.append("layer_id = :layer_id")
+    params["layer_id"] = layer_id
+  envelope = _parse_bbox(bbox)
+  if envelope is not None:
+    # ST_Intersects adds the && prefilter itself, so the GiST index on geom is used
+    where_clauses.append("ST_Intersects(geom, ST_MakeEnvelope(:minx, :miny, :maxx, :maxy, 3857))")
+    params.update(zip(("minx", "miny", "maxx", "maxy"), envelope))
+  if after is not None:
+    # Keyset position on ORDER BY order_index, id (NULL order_index sorts last)
+    after_order_index, after_id = after
+    if after_order_index is None:
+      where_clauses.append("(order_index IS NULL AND id > :after_id)")
+    else:
+      where_clauses.append(
+        "(order_index > :after_order_index OR (order_index = :after_order_index AND id > :after_id)"
+        " OR order_index IS NULL)"
+      )
+      params["after_order_index"] = after_order_index
+    params["after_id"] = after_id
+  where_clause = ""
+  if where_clauses:
+    where_clause = "WHERE " + " AND ".join(where_clauses)
+  return where_clause, params
+
+
+async def _features_etag(db: AsyncSession, layer_id: int | None) -> str:
+  # Read before the data query: a write landing in between only makes the
+  # ETag older than the body, which costs the client one extra refetch.
+  if layer_id is not None:
+    return make_etag('layer', layer_id, 'r', await crud.get_layer_revision(db, layer_id))
+  return make_etag('layers', fingerprint(await crud.list_layer_revisions(db)))
+
+
+async def cached_read(
+  request: Request,
+  db: AsyncSession,
+  cache_key: tuple,
+  layer_id: int | None,
+  build: Callable[[], Awaitable[bytes]],
+  media_type: str = 'application/json',
+) -> Response:
+  """Serve a read from the snapshot cache, building and storing it on a miss."""
+  entry = snapshot_cache.get(cache_key)
+  if entry is None:
+    generation = snapshot_cache.generation
+    etag = await _features_etag(db, layer_id)
+    if etag_matches(request, etag):
+      return not_modified(etag)
+    entry = CacheEntry(body=await build(), etag=etag, media_type=media_type)
+    snapshot_cache.put(cache_key, entry, layer_id, generation)
+  return await entry_response(request, entry)
+
+
+def _feature_list_sql(fields: tuple[str, ...], where_clause: str, limit_clause: str = "") -> str:
+  """
+  Select only what the requested FeatureRead fields need. id and order_index
+  are always read because they are the keyset cursor.
+  """
+  select_list = ["id", "order_index"]
+  select_list += [
+    name for name in ('layer_id', 'parent_id', 'name', 'opomba', 'color', 'level', 'depth', 'properties',
+                      'cona', 'max_capacity', 'taken_capacity', 'version')
+    if name in fields
+  ]
+  lateral = ""
+  if {'coordinates', 'shape_gl'} & set(fields):
+    select_list.append("ST_AsGeoJSON(geom)::json as geometry")
+  if {'x_coord', 'y_coord', 'x_coord_gl', 'y_coord_gl'} & set(fields):
+    select_list += ["ST_X(c.centroid) as x_coord", "ST_Y(c.centroid) as y_coord"]
+    lateral = "CROSS JOIN LATERAL (SELECT ST_Centroid(geom) AS centroid) c"
+  return f"""
+    SELECT {", ".join(select_list)}
+    FROM features
+    {lateral}
+    {where_clause}
+    ORDER BY order_index, id
+    {limit_clause}
+  """
+
 
 @router.get('/', response_model=list[schemas.FeatureRead])
-async def get_features(db: AsyncSession = Depends(get_db)):
-  # Use optimized PostGIS query that returns GeoJSON directly
-  query = text("""
-    SELECT 
-        id, layer_id, parent_id, name, opomba, color, level, order_index, depth, properties,
-        ST_AsGeoJSON(geom)::json as geometry,
-        ST_X(ST_Centroid(geom)) as x_coord,
-        ST_Y(ST_Centroid(geom)) as y_coord,
-        cona, max_capacity, taken_capacity
-    FROM features 
-    ORDER BY order_index
-  """)
-  
-  result = await db.execute(query)
-  rows = result.fetchall()
-  
-  out: list[schemas.FeatureRead] = []
-  for row in rows:
-    # Convert GeoJSON to coordinates array for backward compatibility
-    coords: list[list[float]] = []
-    try:
-      if row.geometry and 'coordinates' in row.geometry:
-        # Handle Polygon GeoJSON format
-        if row.geometry['type'] == 'Polygon' and row.geometry['coordinates']:
-          # Take the first ring (exterior ring) of the polygon
-          coords = row.geometry['coordinates'][0]
-        elif row.geometry['type'] == 'MultiPolygon' and row.geometry['coordinates']:
-          # Take the first polygon's first ring
-          coords = row.geometry['coordinates'][0][0]
-    except Exception as e:
-      print(f"Feature {row.id} GeoJSON parsing failed: {e}")
-      coords = []
-    
-    out.append(schemas.FeatureRead(
-      id=row.id, 
-      layer_id=row.layer_id, 
-      parent_id=row.parent_id, 
-      name=row.name, 
-      opomba=row.opomba,
-      color=row.color, 
-      level=row.level, 
-      order_index=row.order_index, 
-      depth=row.depth, 
-      properties=row.properties,
-      coordinates=coords, 
-      x_coord=row.x_coord, 
-      y_coord=row.y_coord,
-      # Pass the GeoJSON geometry directly for MapLibre GL
-      shape_gl=row.geometry,
-      x_coord_gl=row.x_coord,  # Use the same coordinates
-      y_coord_gl=row.y_coord
-    ))
+async def get_features(
+  request: Request,
+  layer_id: int | None = None,
+  bbox: str | None = Query(None, description=BBOX_DESCRIPTION),
+  limit: int | None = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; enables keyset pagination"),
+  cursor: str | None = Query(None, description="X-Next-Cursor value from the previous page"),
+  fields: str | None = Query(None, description=FIELDS_DESCRIPTION),
+  db: AsyncSession = Depends(get_db),
+):
+  """
+  Features ordered by (order_index, id).
+
+  With `limit`, returns one page and an `X-Next-Cursor` header while more rows
+  follow; pass it back as `cursor`. Without `limit`, the whole list is streamed
+  from a server-side cursor in chunks, so memory stays flat however many rows
+  there are. `fields` narrows both the selected columns and the output.
+  """
+  if cursor is not None and limit is None:
+    raise HTTPException(status_code=400, detail="cursor requires limit")
+  fields = _parse_fields(fields, FEATURE_FIELDS)
+  where_clause, params = feature_filters(layer_id, bbox, _decode_cursor(cursor))
+
+  if limit is not None:
+    etag = await _features_etag(db, layer_id)
+    if etag_matches(request, etag):
+      return not_modified(etag)
+    body, next_cursor = await _read_feature_page(db, fields, where_clause, params, limit)
+    headers = cache_headers(etag)
+    if next_cursor is not None:
+      headers['X-Next-Cursor'] = next_cursor
+    return Response(content=body, media_type='application/json', headers=headers)
+
+  cache_key = ('features', fields, tuple(sorted(params.items())))
+  entry = snapshot_cache.get(cache_key)
+  if entry is not None:
+    return await entry_response(request, entry)
+  generation = snapshot_cache.generation
+  etag = await _features_etag(db, layer_id)
+  if etag_matches(request, etag):
+    return not_modified(etag)
+  return StreamingResponse(
+    _stream_features(fields, where_clause, params, cache_key, layer_id, etag, generation),
+    media_type='application/json',
+    headers=cache_headers(etag),
+  )
+
+
+def _encode_cursor(row) -> str:
+  return base64.urlsafe_b64encode(json.dumps([row.order_index, row.id]).encode()).decode()
+
+
+def _decode_cursor(cursor: str | None) -> tuple[int | None, int] | None:
+  if cursor is None:
+    return None
+  try:
+    order_index, feature_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    if not isinstance(feature_id, int) or not isinstance(order_index, (int, type(None))):
+      raise ValueError(cursor)
+  except (ValueError, TypeError):
+    raise HTTPException(status_code=400, detail="Invalid cursor")
+  return order_index, feature_id
+
+
+def _exterior_ring(geometry: dict | None, feature_id: int) -> list:
+  # Convert GeoJSON to coordinates array for backward compatibility
+  coords: list[list[float]] = []
+  try:
+    if geometry and 'coordinates' in geometry:
+      # Handle Polygon GeoJSON format
+      if geometry['type'] == 'Polygon' and geometry['coordinates']:
+        # Take the first ring (exterior ring) of the polygon
+        coords = geometry['coordinates'][0]
+      elif geometry['type'] == 'MultiPolygon' and geometry['coordinates']:
+        # Take the first polygon's first ring
+        coords = geometry['coordinates'][0][0]
+  except Exception as e:
+    print(f"Feature {feature_id} GeoJSON parsing failed: {e}")
+    coords = []
+  return coords
+
+
+def _feature_read(row) -> schemas.FeatureRead:
+  return schemas.FeatureRead(
+    id=row.id, 
+    layer_id=row.layer_id, 
+    parent_id=row.parent_id, 
+    name=row.name, 
+    opomba=row.opomba,
+    color=row.color, 
+    level=row.level, 
+    order_index=row.order_index, 
+    depth=row.depth, 
+    properties=row.properties,
+    coordinates=_exterior_ring(row.geometry, row.id), 
+    x_coord=row.x_coord, 
+    y_coord=row.y_coord,
+    cona=row.cona,
+    max_capacity=row.max_capacity,
+    taken_capacity=row.taken_capacity,
+    # Pass the GeoJSON geometry directly for MapLibre GL
+    shape_gl=row.geometry,
+    x_coord_gl=row.x_coord,  # Use the same coordinates
+    y_coord_gl=row.y_coord,
+    version=row.version,
+  )
+
+
+def _feature_projection(row, fields: tuple[str, ...]) -> dict:
+  out = {}
+  for name in fields:
+    if name == 'coordinates':
+      out[name] = _exterior_ring(row.geometry, row.id)
+    elif name == 'shape_gl':
+      out[name] = row.geometry
+    elif name in ('x_coord', 'x_coord_gl'):
+      out[name] = row.x_coord
+    elif name in ('y_coord', 'y_coord_gl'):
+      out[name] = row.y_coord
+    else:
+      out[name] = getattr(row, name)
   return out
 
 
+def _encode_feature(row, fields: tuple[str, ...]) -> bytes:
+  if fields == FEATURE_FIELDS:
+    return FEATURE_ADAPTER.dump_json(_feature_read(row))
+  # A projection is not a valid FeatureRead, so it is encoded as a plain dict
+  return json.dumps(_feature_projection(row, fields), separators=(',', ':')).encode('utf-8')
+
+
+async def _read_feature_page(
+  db: AsyncSession, fields: tuple[str, ...], where_clause: str, params: dict, limit: int
+) -> tuple[bytes, str | None]:
+  # One extra row tells whether another page follows
+  query = text(_feature_list_sql(fields, where_clause, "LIMIT :limit"))
+  result = await db.execute(query, {**params, "limit": limit + 1})
+  rows = result.fetchall()
+  next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+  return b'[' + b','.join(_encode_feature(row, fields) for row in rows[:limit]) + b']', next_cursor
+
+
+async def _stream_features(
+  fields: tuple[str, ...], where_clause: str, params: dict, cache_key: tuple, layer_id: int | None, etag: str,
+  generation: int,
+) -> AsyncIterator[bytes]:
+  """
+  Yield the JSON array chunk by chunk from a server-side cursor. Chunks are
+  also collected for the snapshot cache until the body outgrows
+  settings.snapshot_cache_stream_max_bytes.
+  """
+  query = text(_feature_list_sql(fields, where_clause))
+  chunks: list[bytes] | None = [b'[']
+  size = 0
+  yield b'['
+  # Own session: the request-scoped one may be closed before streaming ends
+  async with SessionLocal() as session:
+    result = await session.stream(query, params)
+    separator = b''
+    async for rows in result.partitions(STREAM_CHUNK_ROWS):
+      chunk = separator + b','.join(_encode_feature(row, fields) for row in rows)
+      separator = b','
+      if chunks is not None:
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > settings.snapshot_cache_stream_max_bytes:
+          chunks = None
+      yield chunk
+  yield b']'
+  if chunks is not None:
+    chunks.append(b']')
+    snapshot_cache.put(cache_key, CacheEntry(body=b''.join(chunks), etag=etag), layer_id, generation)
+
+
 @router.get('/geojson')
-async def get_features_geojson(layer_id: int | None = None, db: AsyncSession = Depends(get_db)):
+async def get_features_geojson(
+  request: Request,
+  layer_id: int | None = None,
+  bbox: str | None = Query(None, description=BBOX_DESCRIPTION),
+  zoom: float | None = Query(None, ge=0, le=24, description="Map zoom; simplifies to ~1px at floor(zoom)"),
+  tolerance: float | None = Query(None, gt=0, description="Explicit simplification tolerance in geometry units"),
+  precision: int | None = Query(None, ge=0, le=15, description="Decimal digits of output coordinates"),
+  fields: str | None = Query(None, description=FIELDS_DESCRIPTION),
+  db: AsyncSession = Depends(get_db),
+):
   """
   Returns features as a proper GeoJSON FeatureCollection for MapLibre GL.
-  This is the most efficient format for mapping libraries.
-  Optionally filter by layer_id.
+  This is the most efficient format for mapping libraries: PostGIS builds the
+  whole collection and the JSON text is sent back without being decoded.
+  Optionally filter by layer_id and by a viewport bbox.
+  Overview screens can pass zoom (or tolerance) to get topology-preserving
+  simplified rings, and precision to cap coordinate decimals; each zoom
+  bucket is cached separately. `fields` narrows the feature properties (and
+  the columns read) to what a thin client draws; geometry is always sent.
+  Answers 304 when If-None-Match carries the current layer revision.
   """
-  if layer_id is not None:
-    query = text("""
-      SELECT 
-          id, layer_id, parent_id, name, opomba, color, level, order_index, depth, properties,
-          ST_AsGeoJSON(geom)::json as geometry,
-          cona, max_capacity, taken_capacity
-      FROM features 
-      WHERE layer_id = :layer_id
-      ORDER BY order_index
-    """)
-    result = await db.execute(query, {"layer_id": layer_id})
+  fields = _parse_fields(fields, GEOJSON_FIELDS)
+  where_clause, params = feature_filters(layer_id, bbox)
+  geometry = "geom"
+  tolerance = _simplify_tolerance(zoom, tolerance)
+  if tolerance is not None:
+    geometry = "ST_SimplifyPreserveTopology(geom, :tolerance)"
+    params["tolerance"] = tolerance
+  if precision is not None:
+    geometry = f"ST_AsGeoJSON({geometry}, :precision)"
+    params["precision"] = precision
   else:
-    query = text("""
-      SELECT 
-          id, layer_id, parent_id, name, opomba, color, level, order_index, depth, properties,
-          ST_AsGeoJSON(geom)::json as geometry,
-          cona, max_capacity, taken_capacity
-      FROM features 
-      ORDER BY order_index
-    """)
-    result = await db.execute(query)
-  
-  rows = result.fetchall()
-  
-  features = []
-  for row in rows:
-    feature = {
-      "type": "Feature",
-      "geometry": row.geometry,
-      "properties": {
-        "id": row.id,
-        "layer_id": row.layer_id,
-        "parent_id": row.parent_id,
-        "name": row.name,
-        "opomba": row.opomba,
-        "color": row.color,
-        "level": row.level,
-        "order_index": row.order_index,
-        "depth": row.depth,
-        "cona": row.cona,
-        "max_capacity": row.max_capacity,
-        "taken_capacity": row.taken_capacity,
-        # Merge additional properties
-        **(row.properties or {})
-      }
-    }
-    features.append(feature)
-  
-  return {
-    "type": "FeatureCollection",
-    "features": features
-  }
+    geometry = f"ST_AsGeoJSON({geometry})"
+  cache_key = ('geojson', fields, tuple(sorted(params.items())))
+  return await cached_read(
+    request, db, cache_key, layer_id, lambda: _read_feature_collection(db, where_clause, params, geometry, fields)
+  )
+
+
+async def _read_feature_collection(
+  db: AsyncSession, where_clause: str, params: dict, geometry: str, fields: tuple[str, ...]
+) -> bytes:
+  query = text(f"""
+    SELECT json_build_object(
+        'type', 'FeatureCollection',
+        'features', COALESCE(json_agg({_geojson_feature_sql(geometry, fields)} ORDER BY order_index, id), '[]'::json)
+    )::text AS collection
+    FROM features
+    {where_clause}
+  """)
+  result = await db.execute(query, params)
+  return result.scalar_one().encode('utf-8')
+
+
+@router.get('/changes')
+async def get_feature_changes(
+  layer_id: int,
+  since: int = Query(..., ge=0, description="Layer revision the client already has"),
+  fields: str | None = Query(None, description=FIELDS_DESCRIPTION),
+  db: AsyncSession = Depends(get_db),
+):
+  """
+  Delta sync for long-running viewers: the features of a layer created or
+  changed after revision `since` (same shape as /features/geojson) and the
+  ids that left the layer. The FeatureCollection carries the layer's current
+  `revision` to pass as `since` next time; `since=0` returns the whole layer.
+  One statement, so the revision, features and tombstones come from the
+  same snapshot.
+  """
+  fields = _parse_fields(fields, GEOJSON_FIELDS)
+  # Rows written before revisions existed carry revision 0
+  changed = "AND revision > :since" if since > 0 else ""
+  query = text(f"""
+    SELECT json_build_object(
+        'type', 'FeatureCollection',
+        'revision', (SELECT revision FROM layers WHERE id = :layer_id),
+        'deleted', COALESCE((
+            SELECT json_agg(DISTINCT t.feature_id)
+            FROM feature_tombstones t
+            WHERE t.layer_id = :layer_id AND t.revision > :since
+              -- moved away and back again: the live row below wins
+              AND NOT EXISTS (SELECT 1 FROM features f WHERE f.id = t.feature_id AND f.layer_id = :layer_id)
+        ), '[]'::json),
+        'features', COALESCE((
+            SELECT json_agg({_geojson_feature_sql(fields=fields)} ORDER BY order_index, id)
+            FROM features
+            WHERE layer_id = :layer_id {changed}
+        ), '[]'::json)
+    )::text
+  """)
+  result = await db.execute(query, {"layer_id": layer_id, "since": since})
+  return Response(content=result.scalar_one(), media_type='application/json')
+
+
+SSE_KEEPALIVE_SECONDS = 15
+
+
+@router.get('/events')
+async def get_feature_events(request: Request, layer_id: int | None = None):
+  """
+  Server-sent events of feature writes, optionally for one layer only.
+  Each `change` event carries layer_id, revision, op and the changed/deleted
+  ids (null when too many; refetch via /features/changes). A `resync` event
+  means events may have been lost and the client should refetch.
+  """
+  subscription = feature_events.subscribe(layer_id)
+
+  async def stream() -> AsyncIterator[str]:
+    try:
+      while not await request.is_disconnected():
+        try:
+          event = await asyncio.wait_for(subscription.queue.get(), SSE_KEEPALIVE_SECONDS)
+        except asyncio.TimeoutError:
+          yield ": keepalive\n\n"
+          continue
+        name = 'resync' if event.get('op') == 'resync' else 'change'
+        yield f"event: {name}\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+    finally:
+      feature_events.unsubscribe(subscription)
+
+  # X-Accel-Buffering: nginx must pass events through as they are written
+  return StreamingResponse(
+    stream(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+  )
+
+
+# Stored rings hold longitude/latitude values (that is what the viewer draws)
+# even though the column is declared SRID 3857, so tiles reinterpret them as
+# 4326 before projecting to web mercator. The tile envelope is mapped back the
+# same way for the `&&` filter, which keeps the GiST index on geom usable.
+MVT_TILE_SQL = """
+  WITH bounds AS (
+    SELECT ST_TileEnvelope(:z, :x, :y) AS tile
+  ),
+  tile_features AS (
+    SELECT
+        ST_AsMVTGeom(ST_Transform(ST_SetSRID(f.geom, 4326), 3857), bounds.tile, 4096, 64, true) AS geom,
+        f.id, f.layer_id, f.parent_id, f.name, f.opomba, f.color, f.level, f.order_index, f.depth,
+        f.cona, f.max_capacity, f.taken_capacity
+    FROM features f, bounds
+    WHERE f.layer_id = :layer_id
+      AND f.geom && ST_SetSRID(ST_Transform(bounds.tile, 4326), 3857)
+  )
+  SELECT ST_AsMVT(tile_features.*, 'features', 4096, 'geom')
+  FROM tile_features
+  WHERE geom IS NOT NULL
+"""
+
+
+@router.get('/tiles/{layer_id}/{z}/{x}/{y}.mvt')
+async def get_feature_tile(request: Request, layer_id: int, z: int, x: int, y: int, db: AsyncSession = Depends(get_db)):
+  """
+  Returns one Mapbox Vector Tile of a layer's features (source-layer "features")
+  with the same typed attributes as /features/geojson. The free-form
+  `properties` JSON is left out to keep tiles small.
+  """
+  if not 0 <= z <= 24 or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+    raise HTTPException(status_code=400, detail=f"Invalid tile coordinates {z}/{x}/{y}")
+
+  async def read_tile() -> bytes:
+    result = await db.execute(text(MVT_TILE_SQL), {"layer_id": layer_id, "z": z, "x": x, "y": y})
+    return bytes(result.scalar_one_or_none() or b'')
+
+  return await cached_read(
+    request, db, ('tile', layer_id, z, x, y), layer_id, read_tile,
+    media_type='application/vnd.mapbox-vector-tile',
+  )
+
+
+@router.get('/write_queue')
+async def get_write_queue_stats():
+  """Depth, lag and counters of the deferred geometry write queue."""
+  return geometry_write_queue.stats()
+
+
+@router.post('/write_queue/flush')
+async def flush_write_queue():
+  """Write every queued geometry now instead of waiting for the next interval."""
+  try:
+    flushed = await geometry_write_queue.flush()
+  except Exception as e:
+    raise HTTPException(status_code=503, detail=f"Flush failed: {e}")
+  return {"flushed": flushed, **geometry_write_queue.stats()}
 
 
 @router.post('/', response_model=schemas.FeatureRead)
 async def post_feature(payload: schemas.FeatureCreate, db: AsyncSession = Depends(get_db)):
-  f = await crud.create_feature(db, payload)
-  # For now, return the coordinates from the input payload
-  # TODO: Extract coordinates from WKT for proper round-trip
-  return schemas.FeatureRead(
-    id=f.id, layer_id=f.layer_id, parent_id=f.parent_id, name=f.name, opomba=f.opomba,
-    color=f.color, level=f.level, order_index=f.order_index, depth=f.depth, properties=f.properties,
-    coordinates=payload.coordinates, x_coord=f.x_coord, y_coord=f.y_coord,
-    cona=f.cona, max_capacity=f.max_capacity, taken_capacity=f.taken_capacity,
-    shape_gl=None, x_coord_gl=f.x_coord, y_coord_gl=f.y_coord
+  try:
+    row = await crud.create_feature(db, payload)
+  except (ValueError, TypeError) as e:
+    raise HTTPException(status_code=400, detail=str(e))
+  # Geometry and centroid come back from the INSERT itself
+  return _feature_read(row)
+
+
+def _parse_bulk_body(body: bytes, content_type: str) -> list:
+  """Items of a JSON array or NDJSON body; an unparseable NDJSON line stays as a string."""
+  if content_type.split(';')[0].strip() in ('application/x-ndjson', 'application/ndjson'):
+    items = []
+    for line in body.splitlines():
+      if not line.strip():
+        continue
+      try:
+        items.append(json.loads(line))
+      except ValueError:
+        items.append(line.decode('utf-8', 'replace'))
+    return items
+  try:
+    items = json.loads(body)
+  except ValueError:
+    raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+  if not isinstance(items, list):
+    raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+  return items
+
+
+@router.post('/bulk', response_model=schemas.FeatureBulkCreateResponse)
+async def bulk_create_features(request: Request, db: AsyncSession = Depends(get_db)):
+  """Create a batch of features (JSON array or NDJSON, one FeatureCreate each).
+
+  Items that fail validation or insertion are listed under `errors` by their
+  position in the batch; the others are created in one statement.
+  """
+  raw_items = _parse_bulk_body(await request.body(), request.headers.get('content-type', ''))
+  if len(raw_items) > MAX_BULK_CREATE:
+    raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_CREATE} features per batch")
+  items = []
+  errors = []
+  for position, raw in enumerate(raw_items):
+    try:
+      items.append((position, schemas.FeatureCreate.model_validate(raw)))
+    except ValidationError as e:
+      error = e.errors()[0]
+      location = '.'.join(str(part) for part in error['loc']) or 'item'
+      errors.append((position, f"{location}: {error['msg']}"))
+  created, failed = await crud.bulk_create_features(db, items)
+  return schemas.FeatureBulkCreateResponse(
+    created_count=len(created),
+    created=[schemas.FeatureBulkCreateItem(index=position, id=feature_id) for position, feature_id in created],
+    errors=[schemas.FeatureBulkCreateError(index=position, error=message) for position, message in sorted(errors + failed)],
+  )
+
+
+@router.post('/bulk_delete', response_model=schemas.FeatureBulkDeleteResponse)
+async def bulk_delete_features(payload: schemas.FeatureBulkDelete, db: AsyncSession = Depends(get_db)):
+  """Delete features by id list and/or subtree root, descendants included, in one statement."""
+  root_ids = payload.ids + ([payload.root_id] if payload.root_id is not None else [])
+  if not root_ids:
+    raise HTTPException(status_code=400, detail="Provide ids or root_id")
+  deleted_ids = await crud.bulk_delete_features(db, root_ids)
+  return schemas.FeatureBulkDeleteResponse(deleted_count=len(deleted_ids), deleted_ids=deleted_ids)
+
+
+@router.post('/bulk_patch', response_model=schemas.FeatureBulkUpdateResponse)
+async def bulk_patch_features(payload: schemas.FeatureBulkPatch, db: AsyncSession = Depends(get_db)):
+  """Set color, layer_id, max_capacity and/or opomba on every listed feature in one statement."""
+  updated_count, failed_ids = await crud.bulk_patch_features(db, payload)
+  return schemas.FeatureBulkUpdateResponse(updated_count=updated_count, failed_ids=failed_ids)
+
+
+@router.post('/{feature_id}/transform', response_model=schemas.FeatureTransformResponse)
+async def transform_feature_subtree(feature_id: int, payload: schemas.FeatureTransform, db: AsyncSession = Depends(get_db)):
+  """Scale and rotate a feature and its descendants about a pivot, then translate them, in one statement."""
+  updated_ids = await crud.transform_subtree(db, feature_id, payload)
+  if updated_ids is None:
+    raise HTTPException(status_code=404, detail="Feature not found")
+  return schemas.FeatureTransformResponse(updated_count=len(updated_ids), updated_ids=updated_ids)
+
+
+def _check_capacity_owner() -> None:
+  # taken_capacity has one writer: the occupancy sync, or these endpoints when it is off
+  if settings.occupancy_sync_interval_seconds > 0:
+    raise HTTPException(
+      status_code=409,
+      detail="taken_capacity is synced from the container database (OCCUPANCY_SYNC_INTERVAL_SECONDS)",
+    )
+
+
+def _capacity_response(updated: list, failed_ids: list[int]) -> schemas.FeatureCapacityResponse:
+  return schemas.FeatureCapacityResponse(
+    updated=[
+      schemas.FeatureCapacity(id=row.id, taken_capacity=row.taken_capacity, max_capacity=row.max_capacity)
+      for row in updated
+    ],
+    failed_ids=failed_ids,
   )
 
 
+@router.post('/capacity', response_model=schemas.FeatureCapacityResponse)
+async def adjust_capacities(payload: schemas.FeatureCapacityUpdate, db: AsyncSession = Depends(get_db)):
+  """Apply many taken_capacity deltas, rolled up to the ancestors, in one transaction.
+
+  Unknown ids and decrements that would take a row below zero come back in failed_ids.
+  """
+  _check_capacity_owner()
+  updated, failed_ids = await crud.adjust_capacity(db, payload.events)
+  return _capacity_response(updated, failed_ids)
+
+
+@router.post('/{feature_id}/capacity', response_model=schemas.FeatureCapacityResponse)
+async def adjust_capacity(
+  feature_id: int,
+  delta: int = Query(
+    ..., ge=-2**31, le=2**31 - 1, description="Change of taken_capacity, also applied to every ancestor"
+  ),
+  db: AsyncSession = Depends(get_db),
+):
+  _check_capacity_owner()
+  updated, failed_ids = await crud.adjust_capacity(db, [schemas.FeatureCapacityDelta(id=feature_id, delta=delta)])
+  if failed_ids:
+    exists = await db.scalar(text("SELECT 1 FROM features WHERE id = :id"), {"id": feature_id})
+    if exists is None:
+      raise HTTPException(status_code=404, detail="Feature not found")
+    raise HTTPException(status_code=409, detail="taken_capacity would drop below 0")
+  return _capacity_response(updated, failed_ids)
+
+
 @router.delete('/{feature_id}', response_model=schemas.FeatureDeleteResponse)
 async def delete_feature(feature_id: int, db: AsyncSession = Depends(get_db)):
   await crud.delete_feature(db, feature_id)
   return schemas.FeatureDeleteResponse(ok=True)
 
 
+# Fields a deferred PATCH may carry; anything else is written directly
+DEFERRABLE_FIELDS = {'coordinates', 'x_coord', 'y_coord', 'version'}
+
+
 @router.patch('/{feature_id}', response_model=schemas.FeatureRead)
-async def patch_feature(feature_id: int, payload: schemas.FeatureUpdate, db: AsyncSession = Depends(get_db)):
-  f = await crud.update_feature(db, feature_id, payload)
-  if f is None:
+async def patch_feature(
+  feature_id: int,
+  payload: schemas.FeatureUpdate,
+  defer: bool = Query(False, description="Queue a geometry-only edit for the next coalesced flush (202)"),
+  db: AsyncSession = Depends(get_db),
+):
+  if defer:
+    fields = payload.model_fields_set
+    if 'coordinates' not in fields or not fields <= DEFERRABLE_FIELDS or payload.coordinates is None:
+      raise HTTPException(status_code=400, detail="Deferred updates carry only coordinates (and x_coord/y_coord)")
+    ring = payload.coordinates
+    try:
+      item = schemas.FeatureBulkUpdateItem(
+        id=feature_id, coordinates=ring,
+        x_coord=payload.x_coord if payload.x_coord is not None else ring[0][0],
+        y_coord=payload.y_coord if payload.y_coord is not None else ring[0][1],
+        version=payload.version,
+      )
+      geometry_write_queue.enqueue(item)
+    except (IndexError, TypeError, ValueError) as e:
+      raise HTTPException(status_code=400, detail=str(e) or "Invalid coordinates")
+    return JSONResponse({"queued": True, "depth": geometry_write_queue.depth}, status_code=202)
+
+  if 'coordinates' in payload.model_fields_set:
+    # This write supersedes any queued geometry of the feature
+    await geometry_write_queue.discard(feature_id)
+  try:
+    row = await crud.update_feature(db, feature_id, payload)
+  except crud.StaleVersionError as e:
+    raise HTTPException(status_code=409, detail=str(e))
+  except (ValueError, TypeError) as e:
+    raise HTTPException(status_code=400, detail=str(e) or "Invalid coordinates")
+  if row is None:
     raise HTTPException(status_code=404, detail="Feature not found")
-  # For now, return coordinates from payload if provided, otherwise empty
-  # TODO: Extract coordinates from WKT for proper round-trip
-  coords = payload.coordinates if payload.coordinates else []
-  return schemas.FeatureRead(
-    id=f.id, layer_id=f.layer_id, parent_id=f.parent_id, name=f.name, opomba=f.opomba,
-    color=f.color, level=f.level, order_index=f.order_index, depth=f.depth, properties=f.properties,
-    coordinates=coords, x_coord=f.x_coord, y_coord=f.y_coord,
-    cona=f.cona, max_capacity=f.max_capacity, taken_capacity=f.taken_capacity,
-    shape_gl=None, x_coord_gl=f.x_coord, y_coord_gl=f.y_coord
-  )
+  return _feature_read(row)
 
 
 @router.post('/bulk_update', response_model=schemas.FeatureBulkUpdateResponse)
 async def bulk_update_features(payload: schemas.FeatureBulkUpdate, db: AsyncSession = Depends(get_db)):
-  """Bulk update feature geometries in a single transaction."""
+  """Bulk update feature geometries in a single transaction; stale or unknown items come back in failed_ids."""
   updated_count, failed_ids = await crud.bulk_update_features(db, payload.features)
   return schemas.FeatureBulkUpdateResponse(
     updated_count=updated_count,
@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, Query, Request
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..db import get_db
+from .. import schemas
+from .features import BBOX_DESCRIPTION, feature_filters, cached_read
+
+
+router = APIRouter(prefix='/features', tags=['features-v2'])
+
+
+@router.get('/', response_model=list[schemas.FeatureReadV2])
+async def get_features_v2(
+  request: Request,
+  layer_id: int | None = None,
+  bbox: str | None = Query(None, description=BBOX_DESCRIPTION),
+  db: AsyncSession = Depends(get_db),
+):
+  """
+  Slim feature list: geometry is sent once as GeoJSON and the centroid is
+  computed once per row. PostGIS renders the JSON array, so no per-object
+  pydantic validation happens on the way out. v1 `/api/features/` keeps the
+  old shape for existing clients.
+  """
+  where_clause, params = feature_filters(layer_id, bbox)
+
+  async def read_features() -> bytes:
+    query = text(f"""
+      SELECT COALESCE(json_agg(json_build_object(
+          'id', id,
+          'layer_id', layer_id,
+          'parent_id', parent_id,
+          'name', name,
+          'opomba', opomba,
+          'color', color,
+          'level', level,
+          'order_index', order_index,
+          'depth', depth,
+          'properties', properties,
+          'geometry', ST_AsGeoJSON(geom)::json,
+          'x_coord', ST_X(c.centroid),
+          'y_coord', ST_Y(c.centroid),
+          'cona', cona,
+          'max_capacity', max_capacity,
+          'taken_capacity', taken_capacity,
+          'version', version
+      ) ORDER BY order_index, id), '[]'::json)::text
+      FROM features
+      CROSS JOIN LATERAL (SELECT ST_Centroid(geom) AS centroid) c
+      {where_clause}
+    """)
+    result = await db.execute(query, params)
+    return result.scalar_one().encode('utf-8')
+
+  return await cached_read(request, db, ('features_v2', tuple(sorted(params.items()))), layer_id, read_features)
@@ -1,19 +1,29 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..db import get_db
+from ..cache import CacheEntry, snapshot_cache
+from ..http_cache import make_etag, fingerprint, entry_response
 from .. import crud, schemas
 
 
 router = APIRouter(prefix='/layers', tags=['layers'])
 
+LAYER_LIST_ADAPTER = TypeAdapter(list[schemas.LayerRead])
+
 
 @router.get('/', response_model=list[schemas.LayerRead])
-async def get_layers(db: AsyncSession = Depends(get_db)):
-  return await crud.list_layers(db)
+async def get_layers(request: Request, db: AsyncSession = Depends(get_db)):
+  entry = snapshot_cache.get(('layers',))
+  if entry is None:
+    generation = snapshot_cache.generation
+    layers = [schemas.LayerRead.model_validate(l) for l in await crud.list_layers(db)]
+    etag = make_etag('layers', fingerprint(l.model_dump() for l in layers))
+    entry = CacheEntry(body=LAYER_LIST_ADAPTER.dump_json(layers), etag=etag)
+    snapshot_cache.put(('layers',), entry, None, generation)
+  return await entry_response(request, entry)
 
 
 @router.post('/', response_model=schemas.LayerRead)
 async def post_layer(payload: schemas.LayerCreate, db: AsyncSession = Depends(get_db)):
   return await crud.create_layer(db, payload)
-
-
@@ -1,5 +1,5 @@
 from typing import Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class LayerBase(BaseModel):
@@ -16,6 +16,7 @@ class LayerCreate(LayerBase):
 
 class LayerRead(LayerBase):
   id: int
+  revision: int = 0
 
   class Config:
     from_attributes = True
@@ -68,11 +69,37 @@ class FeatureRead(BaseModel):
   shape_gl: Optional[dict] = None
   x_coord_gl: Optional[float] = None
   y_coord_gl: Optional[float] = None
+  # Row version; send it back as the expected version of a write
+  version: Optional[int] = None
 
   class Config:
     from_attributes = True
 
 
+class FeatureReadV2(BaseModel):
+  """Slim read model of /api/v2/features: geometry once, centroid once."""
+  id: int
+  layer_id: int
+  parent_id: Optional[int]
+  name: str
+  opomba: Optional[str]
+  color: Optional[str]
+  level: str
+  order_index: Optional[int]
+  depth: Optional[int]
+  properties: dict
+  # GeoJSON geometry as stored in PostGIS
+  geometry: Optional[dict]
+  # Centroid of the geometry
+  x_coord: Optional[float]
+  y_coord: Optional[float]
+  cona: Optional[str]
+  max_capacity: Optional[int]
+  taken_capacity: Optional[int]
+  # Row version; send it back as the expected version of a write
+  version: int
+
+
 class FeatureDeleteResponse(BaseModel):
   ok: bool
 
@@ -94,6 +121,8 @@ class FeatureUpdate(BaseModel):
   cona: Optional[str] = None
   max_capacity: Optional[int] = None
   taken_capacity: Optional[int] = None
+  # Expected row version; the write is rejected if the row has moved on
+  version: Optional[int] = None
 
 
 class FeatureBulkUpdateItem(BaseModel):
@@ -101,6 +130,8 @@ class FeatureBulkUpdateItem(BaseModel):
   coordinates: list
   x_coord: float
   y_coord: float
+  # Expected row version; a stale item is reported in failed_ids
+  version: Optional[int] = None
 
 
 class FeatureBulkUpdate(BaseModel):
@@ -109,4 +140,83 @@ class FeatureBulkUpdate(BaseModel):
 
 class FeatureBulkUpdateResponse(BaseModel):
   updated_count: int
-  failed_ids: list[int]
\ No newline at end of file
+  failed_ids: list[int]
+
+
+class FeatureBulkCreateItem(BaseModel):
+  index: int
+  id: int
+
+
+class FeatureBulkCreateError(BaseModel):
+  index: int
+  error: str
+
+
+class FeatureBulkCreateResponse(BaseModel):
+  created_count: int
+  # Positions refer to the submitted array / NDJSON lines
+  created: list[FeatureBulkCreateItem]
+  errors: list[FeatureBulkCreateError]
+
+
+class FeatureBulkDelete(BaseModel):
+  # Descendants of every listed feature are deleted with it (parent_id cascades)
+  ids: list[int] = []
+  # Subtree root, e.g. a polje together with its subzone/vrsta children
+  root_id: Optional[int] = None
+
+
+class FeatureBulkDeleteResponse(BaseModel):
+  deleted_count: int
+  deleted_ids: list[int]
+
+
+class FeatureBulkPatch(BaseModel):
+  ids: list[int]
+  # Only the fields that are sent are changed
+  color: Optional[str] = None
+  layer_id: Optional[int] = None
+  max_capacity: Optional[int] = None
+  opomba: Optional[str] = None
+
+
+class FeatureTransform(BaseModel):
+  """Affine transform of a feature subtree: scale and rotate about `pivot`, then translate."""
+  # NaN/Infinity would be written into every geometry of the subtree
+  model_config = ConfigDict(allow_inf_nan=False)
+
+  dx: float = 0
+  dy: float = 0
+  # Degrees, counter-clockwise
+  angle: float = 0
+  scale: float = Field(1, gt=0)
+  # [x, y]; defaults to the root feature's centroid
+  pivot: Optional[tuple[float, float]] = None
+
+
+class FeatureTransformResponse(BaseModel):
+  updated_count: int
+  updated_ids: list[int]
+
+
+class FeatureCapacityDelta(BaseModel):
+  id: int
+  # Positive when containers arrive, negative when they leave; a PostgreSQL integer
+  delta: int = Field(ge=-2**31, le=2**31 - 1)
+
+
+class FeatureCapacityUpdate(BaseModel):
+  events: list[FeatureCapacityDelta]
+
+
+class FeatureCapacity(BaseModel):
+  id: int
+  taken_capacity: Optional[int]
+  max_capacity: Optional[int]
+
+
+class FeatureCapacityResponse(BaseModel):
+  # The targeted features and every ancestor the deltas rolled up into
+  updated: list[FeatureCapacity]
+  failed_ids: list[int]
@@ -0,0 +1,142 @@
+import asyncio
+import time
+from typing import Optional
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from . import crud, schemas
+from .config import settings
+from .db import SessionLocal
+
+
+class GeometryWriteQueue:
+  """Write-behind buffer for geometry edits, coalesced per feature.
+
+  While a shape is dragged the viewer sends a PATCH per move; deferred
+  patches only replace the feature's pending geometry here, and the latest
+  value of every feature is written by one crud.bulk_update_features call
+  per flush. A direct write of a feature's geometry discards its pending one
+  so a later flush cannot overwrite it. Items are validated on the way in;
+  if PostgreSQL still rejects a batch, its items are retried one by one and
+  the ones it refuses are dropped instead of blocking every later flush.
+  """
+
+  def __init__(self, interval_ms: int):
+    self.interval = interval_ms / 1000
+    # feature id -> (latest geometry, monotonic time of the first unflushed edit)
+    self._pending: dict[int, tuple[schemas.FeatureBulkUpdateItem, float]] = {}
+    self._lock = asyncio.Lock()
+    self.enqueued = 0
+    self.coalesced = 0
+    self.flushes = 0
+    self.flushed = 0
+    self.failed = 0
+    self.last_flush_ms: Optional[float] = None
+    self.last_error: Optional[str] = None
+
+  def enqueue(self, item: schemas.FeatureBulkUpdateItem) -> None:
+    """Queue a feature's latest geometry; raises ValueError/TypeError for an unwritable one."""
+    crud._polygon_wkt(item.coordinates)
+    crud._check_point(item.x_coord, item.y_coord)
+    self.enqueued += 1
+    pending = self._pending.get(item.id)
+    if pending is not None:
+      self.coalesced += 1
+      self._pending[item.id] = (item, pending[1])
+    else:
+      self._pending[item.id] = (item, time.monotonic())
+
+  async def discard(self, feature_id: int) -> None:
+    """Drop a feature's pending geometry, waiting out a flush that may already carry it."""
+    async with self._lock:
+      self._pending.pop(feature_id, None)
+
+  @property
+  def depth(self) -> int:
+    return len(self._pending)
+
+  @property
+  def lag(self) -> float:
+    """Seconds the oldest unflushed edit has been waiting."""
+    if not self._pending:
+      return 0.0
+    return time.monotonic() - min(since for _, since in self._pending.values())
+
+  async def flush(self) -> int:
+    """Write every pending geometry in one transaction; returns the number written."""
+    async with self._lock:
+      if not self._pending:
+        return 0
+      batch, self._pending = self._pending, {}
+      started = time.perf_counter()
+      try:
+        updated_count, failed_count = await self._write([item for item, _ in batch.values()])
+        self.last_error = None
+      except Exception as e:
+        self.last_error = str(e)
+        print(f"Geometry write queue flush failed: {e}")
+        if not _rejected(e):
+          # Database unreachable: put the batch back unless newer edits arrived meanwhile
+          for feature_id, pending in batch.items():
+            self._pending.setdefault(feature_id, pending)
+          raise
+        updated_count, failed_count = await self._write_each(batch)
+      self.flushes += 1
+      self.flushed += updated_count
+      self.failed += failed_count
+      self.last_flush_ms = (time.perf_counter() - started) * 1000
+      return updated_count
+
+  async def _write(self, items: list[schemas.FeatureBulkUpdateItem]) -> tuple[int, int]:
+    async with SessionLocal() as db:
+      updated_count, failed_ids = await crud.bulk_update_features(db, items)
+    return updated_count, len(failed_ids)
+
+  async def _write_each(self, batch: dict) -> tuple[int, int]:
+    """Write a rejected batch item by item, dropping the items PostgreSQL refuses."""
+    updated_count = failed_count = 0
+    for feature_id, pending in batch.items():
+      try:
+        updated, failed = await self._write([pending[0]])
+      except Exception as e:
+        if not _rejected(e):
+          self._pending.setdefault(feature_id, pending)
+          continue
+        print(f"Dropped queued geometry of feature {feature_id}: {e}")
+        updated, failed = 0, 1
+      updated_count += updated
+      failed_count += failed
+    return updated_count, failed_count
+
+  async def run(self) -> None:
+    """Flush on a fixed interval until cancelled."""
+    while True:
+      await asyncio.sleep(self.interval)
+      try:
+        await self.flush()
+      except Exception:
+        pass  # Already recorded; retried on the next tick
+
+  def stats(self) -> dict:
+    return {
+      "depth": self.depth,
+      "lag_seconds": self.lag,
+      "interval_ms": self.interval * 1000,
+      "enqueued": self.enqueued,
+      "coalesced": self.coalesced,
+      "flushes": self.flushes,
+      "flushed": self.flushed,
+      "failed": self.failed,
+      "last_flush_ms": self.last_flush_ms,
+      "last_error": self.last_error,
+    }
+
+
+def _rejected(error: Exception) -> bool:
+  """Whether PostgreSQL refused the statement itself, as opposed to the connection failing."""
+  return (
+    isinstance(error, DBAPIError)
+    and not isinstance(error, (OperationalError, InterfaceError))
+    and not error.connection_invalidated
+  )
+
+
+geometry_write_queue = GeometryWriteQueue(settings.write_behind_interval_ms)
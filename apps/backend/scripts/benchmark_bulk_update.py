@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark bulk geometry updates: the old per-item ORM loop against the
+single-statement crud.bulk_update_features.
+Every run writes the features' current rings back unchanged, so the only
+lasting effect is bumped revisions.
+"""
+
+import sys
+import os
+import time
+import asyncio
+import argparse
+from statistics import median
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from app import crud, models, schemas
+from app.db import SessionLocal
+
+
+async def load_items(layer_id: int, count: int) -> list[schemas.FeatureBulkUpdateItem]:
+    """Current exterior rings of up to `count` features on the layer."""
+    async with SessionLocal() as db:
+        result = await db.execute(text("""
+            SELECT id, ST_AsGeoJSON(geom)::json -> 'coordinates' -> 0 AS ring, x_coord, y_coord
+            FROM features
+            WHERE layer_id = :layer_id AND geom IS NOT NULL
+            ORDER BY id
+            LIMIT :count
+        """), {"layer_id": layer_id, "count": count})
+        return [
+            schemas.FeatureBulkUpdateItem(id=row.id, coordinates=row.ring, x_coord=row.x_coord, y_coord=row.y_coord)
+            for row in result
+        ]
+
+
+async def legacy_bulk_update(items: list[schemas.FeatureBulkUpdateItem]) -> int:
+    """The previous implementation: one db.get() and one UPDATE per item."""
+    updated_count = 0
+    async with SessionLocal() as db:
+        for item in items:
+            obj = await db.get(models.Feature, item.id)
+            if obj is None:
+                continue
+            ring = item.coordinates
+            if ring[0] != ring[-1]:
+                ring = ring + [ring[0]]
+            obj.geom = 'POLYGON((' + ','.join(f"{x} {y}" for x, y in ring) + '))'
+            obj.x_coord = item.x_coord
+            obj.y_coord = item.y_coord
+            updated_count += 1
+        await db.commit()
+    return updated_count
+
+
+async def set_based_bulk_update(items: list[schemas.FeatureBulkUpdateItem]) -> int:
+    async with SessionLocal() as db:
+        updated_count, _ = await crud.bulk_update_features(db, items)
+    return updated_count
+
+
+async def run(layer_id: int, count: int, repeat: int):
+    items = await load_items(layer_id, count)
+    if not items:
+        print(f"No features with geometry on layer {layer_id}")
+        return
+    print(f"Updating {len(items)} features on layer {layer_id}, {repeat} runs each")
+
+    for name, update in (("per-item ORM", legacy_bulk_update), ("single statement", set_based_bulk_update)):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            updated = await update(items)
+            timings.append(time.perf_counter() - start)
+        print(f"  {name:<18} {median(timings) * 1000:9.1f} ms median "
+              f"({min(timings) * 1000:.1f} ms best, {updated} rows)")
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--layer-id", type=int, required=True)
+    parser.add_argument("--count", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.layer_id, args.count, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
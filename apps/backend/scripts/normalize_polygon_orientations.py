@@ -16,6 +16,7 @@ import geoalchemy2.functions as func
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.config import settings
+from app.crud import record_layer_rewrite
 
 
 class PolygonOrientationNormalizer:
@@ -255,6 +256,9 @@ class PolygonOrientationNormalizer:
                     if (i + 1) % 100 == 0:
                         print(f"Processed {i + 1}/{len(polygons)} polygons...")
                 
+                # New layer revision and NOTIFY so running servers drop cached layouts
+                record_layer_rewrite(conn, [layer_id])
+                
                 # Commit transaction
                 trans.commit()
                 print(f"Successfully normalized {len(polygons)} polygons")
@@ -22,6 +22,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from sqlalchemy import create_engine, text
 from app.config import settings
+from app.crud import record_layer_rewrite
 
 
 class OptimizedDataMigrator:
@@ -219,8 +220,9 @@ class OptimizedDataMigrator:
                     DELETE FROM features WHERE layer_id IN (
                         SELECT id FROM layers WHERE name = 'Odlagalne cone' AND type = 'bulk'
                     )
+                    RETURNING id, layer_id
                 """)
-                conn.execute(clear_query)
+                deleted = [(row.id, row.layer_id) for row in conn.execute(clear_query)]
                 print("Cleared existing features for fresh migration")
                 
                 # Get or create the main layer
@@ -537,6 +539,9 @@ class OptimizedDataMigrator:
                 """)
                 conn.execute(vrsta_direct_update_query, {'layer_id': layer_id})
                 
+                # New layer revision, tombstones and NOTIFY so running servers drop cached layouts
+                record_layer_rewrite(conn, [layer_id], deleted)
+                
                 # Commit transaction
                 trans.commit()
                 
@@ -25,6 +25,7 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from sqlalchemy import create_engine, text
 from app.config import settings
+from app.crud import record_layer_rewrite
 
 
 class LeanTeamsDataMigrator:
@@ -230,6 +231,7 @@ class LeanTeamsDataMigrator:
                 # Get or create layer
                 layer_query = text("SELECT id FROM layers WHERE name = 'Stroji' AND type = 'lean_teams'")
                 layer_id = conn.execute(layer_query).scalar()
+                deleted = []
                 
                 if layer_id is None:
                     layer_id = conn.execute(text("""
@@ -239,7 +241,10 @@ class LeanTeamsDataMigrator:
                     """)).scalar()
                     print(f"Created layer: Stroji (ID: {layer_id})")
                 else:
-                    conn.execute(text("DELETE FROM features WHERE layer_id = :layer_id"), {'layer_id': layer_id})
+                    result = conn.execute(
+                        text("DELETE FROM features WHERE layer_id = :layer_id RETURNING id"), {'layer_id': layer_id}
+                    )
+                    deleted = [(row.id, layer_id) for row in result]
                     print(f"Using existing layer: Stroji (ID: {layer_id}), cleared old data")
                 
                 # Build features
@@ -421,6 +426,9 @@ class LeanTeamsDataMigrator:
                 for row in result:
                     print(f"  {row[0]}: {row[1]} total, {row[2]} with parent")
                 
+                # New layer revision, tombstones and NOTIFY so running servers drop cached layouts
+                record_layer_rewrite(conn, [layer_id], deleted)
+                
                 trans.commit()
                 
                 result = conn.execute(text("""
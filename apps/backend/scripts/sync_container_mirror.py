@@ -0,0 +1,31 @@
+#!/usr/bin/env python3
+"""
+Refresh the local mirror of zabojniki_proizvodnje_tisna5237_aktivni once.
+The backend also does this every CONTAINER_MIRROR_INTERVAL_SECONDS; use this
+script from cron when that is disabled, or to fill the mirror right after
+running the migrations.
+"""
+
+import sys
+import os
+import time
+import asyncio
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.mirror import MIRROR_TABLE, SOURCE_TABLE, sync_container_mirror
+
+
+def main():
+    """Main entry point."""
+    started = time.perf_counter()
+    rows = asyncio.run(sync_container_mirror())
+    if rows is None:
+        print("Another process is syncing the mirror right now; nothing done")
+        return
+    print(f"Copied {rows} rows from {SOURCE_TABLE} to {MIRROR_TABLE} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()